@@ -1,4 +1,5 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import requests
 import time
 import os
@@ -6,6 +7,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+SESSION_COOKIE = 'wheresmyjobat_session'
+
 st.set_page_config(page_title="WheresMyJobAt | Auto Job Tracker", layout="wide", initial_sidebar_state="collapsed")
 
 # Minimal CSS
@@ -43,15 +46,31 @@ if 'last_hash' not in st.session_state:
 
 # Handle auth success
 if st.query_params.get('auth') == 'success':
+    # Streamlit calls the backend server-side, without the browser's cookies, so swap the one-time code for a session token
+    try:
+        response = requests.post(f"{os.getenv('BACKEND_URL', 'http://localhost')}:{os.getenv('BACKEND_PORT', '5000')}/api/auth/session", json={'code': st.query_params.get('code')})
+        st.session_state.session_token = response.json().get('token') if response.status_code == 200 else None
+    except:
+        st.session_state.session_token = None
     st.query_params.clear()
     st.session_state.post_auth_loading = True
     st.session_state.auth_loading_start = time.time()
     st.rerun()
 
+# st.session_state dies with the browser tab's connection, so the token is also kept in a cookie that
+# Streamlit hands back on every page load; a reload then stays signed in until the session expires
+if not st.session_state.get('session_token'):
+    st.session_state.session_token = st.context.cookies.get(SESSION_COOKIE)
+if st.session_state.session_token and st.session_state.session_token != st.context.cookies.get(SESSION_COOKIE):
+    max_age = int(os.getenv('SESSION_TTL_DAYS', 14)) * 86400
+    components.html(f"<script>window.parent.document.cookie = '{SESSION_COOKIE}={st.session_state.session_token}; path=/; max-age={max_age}; SameSite=Strict';</script>", height=0)
+
 st.markdown("<h1 style='text-align: center; color: #4A90E2;'>WheresMyJobAt</h1><h3 style='text-align: center; color: #666;'>Auto Job Application Tracker</h3>", unsafe_allow_html=True)
 
 # Add real-time WebSocket client
 backend_url = f"{os.getenv('BACKEND_URL', 'http://localhost')}:{os.getenv('BACKEND_PORT', '5000')}"
+session_token = st.session_state.get('session_token') or ''
+auth_headers = {'X-Session-Token': session_token} if session_token else {}
 websocket_js = f"""
 <script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.7.5/socket.io.js"></script>
 <script>
@@ -59,6 +78,8 @@ let socket = null;
 let isConnected = false;
 let reconnectAttempts = 0;
 const maxReconnectAttempts = 5;
+let boardEpoch = null;
+let lastSeq = null;
 
 function updateIndicator(connected) {{
     const indicator = document.getElementById('realtime-indicator');
@@ -106,7 +127,8 @@ function connectWebSocket() {{
         socket = io('{backend_url}', {{
             transports: ['websocket', 'polling'],
             timeout: 10000,
-            forceNew: true
+            forceNew: true,
+            auth: {{ token: '{session_token}' }}
         }});
         
         socket.on('connect', function() {{
@@ -126,9 +148,37 @@ function connectWebSocket() {{
             updateIndicator(false);
         }});
         
-        socket.on('applications_updated', function(data) {{
-            console.log('📊 Applications updated!', data);
-            console.log('Total applications received:', Object.values(data).flat().length);
+        // Server events carry an ack callback; acknowledging keeps our fan-out window open
+        socket.on('resync_required', function(data, ack) {{
+            if (ack) ack();
+            console.log('Server asked for a resync:', data.reason);
+            socket.emit('resync');
+        }});
+        
+        socket.on('board_snapshot', function(data, ack) {{
+            if (ack) ack();
+            console.log('📊 Board snapshot at seq', data.seq);
+            const changed = lastSeq !== null && (data.epoch !== boardEpoch || data.seq !== lastSeq);
+            boardEpoch = data.epoch;
+            lastSeq = data.seq;
+            if (changed) {{
+                forceStreamlitRefresh();
+            }}
+        }});
+        
+        socket.on('application_changed', function(data, ack) {{
+            if (ack) ack();
+            if (data.epoch !== boardEpoch || lastSeq === null || data.seq > lastSeq + 1) {{
+                // Missed a change (or the server restarted): ask for a fresh snapshot
+                console.log('Gap in application changes, resyncing', lastSeq, data.seq);
+                socket.emit('resync');
+                return;
+            }}
+            if (data.seq <= lastSeq) {{
+                return;  // Already reflected in the snapshot we hold
+            }}
+            lastSeq = data.seq;
+            console.log('📊 Application changed!', data);
             
             // Show brief visual feedback for real-time update
             const indicator = document.getElementById('realtime-indicator');
@@ -146,13 +196,14 @@ function connectWebSocket() {{
             forceStreamlitRefresh();
         }});
         
-        socket.on('new_application_detected', function(data) {{
+        socket.on('new_application_detected', function(data, ack) {{
+            if (ack) ack();
             console.log('🎉 NEW APPLICATION DETECTED!', data);
             
             // Show special visual feedback for new applications
             const indicator = document.getElementById('realtime-indicator');
             if (indicator) {{
-                indicator.textContent = '🎉 New App!';
+                indicator.textContent = data.count > 1 ? `🎉 ${{data.count}} New Apps!` : '🎉 New App!';
                 indicator.style.background = '#E74C3C';
                 setTimeout(() => {{
                     indicator.textContent = '🟢 Real-time';
@@ -162,8 +213,8 @@ function connectWebSocket() {{
             
             // Show notification
             if ('Notification' in window && Notification.permission === 'granted') {{
-                new Notification('New Job Application Detected!', {{
-                    body: `${{data.company}} - ${{data.position}} (${{data.stage}})`,
+                new Notification(data.count > 1 ? `${{data.count}} New Job Applications Detected!` : 'New Job Application Detected!', {{
+                    body: data.applications.map(app => `${{app.company}} - ${{app.position}} (${{app.stage}})`).join('\\n'),
                     icon: 'data:image/svg+xml,<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><text y=".9em" font-size="90">🎉</text></svg>'
                 }});
             }}
@@ -221,14 +272,28 @@ st.markdown(websocket_js, unsafe_allow_html=True)
 # API helper
 def api(endpoint, method='GET', data=None):
     try:
-        response = getattr(requests, method.lower())(f"{os.getenv("BACKEND_URL", "http://localhost")}:{os.getenv("BACKEND_PORT", "5000")}{endpoint}", json=data)
+        response = getattr(requests, method.lower())(f"{os.getenv("BACKEND_URL", "http://localhost")}:{os.getenv("BACKEND_PORT", "5000")}{endpoint}", json=data, headers=auth_headers)
         return response.status_code == 200, response.json() if response.content else None
     except:
         return False, None
 
+def get_board():
+    """Conditional GET: keep the last board while the server's ETag says it hasn't changed"""
+    headers = {**auth_headers, 'If-None-Match': st.session_state.board_etag} if st.session_state.get('board_etag') else auth_headers
+    try:
+        response = requests.get(f"{os.getenv("BACKEND_URL", "http://localhost")}:{os.getenv("BACKEND_PORT", "5000")}/api/applications", headers=headers)
+        if response.status_code == 304:
+            return True, st.session_state.board
+        if response.status_code == 200:
+            st.session_state.board_etag, st.session_state.board = response.headers.get('ETag'), response.json()
+            return True, st.session_state.board
+        return False, None
+    except:
+        return False, None
+
 # Get data
 monitor_ok, monitor = api("/api/monitor/status")
-apps_ok, apps = api("/api/applications")
+apps_ok, apps = get_board()
 if not apps_ok:
     st.error("⚠️ Backend not running. Start server: `cd server && python app.py`")
     apps = {"Applied": [], "Interview": [], "Offer": [], "Rejected": []}
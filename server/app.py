@@ -1,51 +1,108 @@
-from flask import Flask, request, jsonify, redirect
+from flask import Flask, Response, request, jsonify, redirect, session
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, disconnect
 from datetime import datetime
 import os
+import json
+import base64
+import secrets
+import threading
 from dotenv import load_dotenv
-from services.email_monitor import initialize_monitor, get_monitor
+from services.application_store import STAGES
+from services.email_service import GmailService
+from services.fanout import FanoutWorker
+from services.tenants import TenantRegistry
 from utils import db
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
-app.secret_key = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
+app.secret_key = os.getenv('FLASK_SECRET_KEY')  # Signs the session cookie that identifies the user; no default, see __main__
 
 # Initialize SocketIO for real-time updates
 socketio = SocketIO(app, cors_allowed_origins="*")
+fanout = FanoutWorker(socketio).start()
 
-current_user_id = None
-
-applications = []
-app_counter = [1]
-email_monitor = initialize_monitor(applications, app_counter)
-
-# Set up real-time broadcast callbacks for email monitor
-email_monitor.set_broadcast_callbacks(
-    broadcast_callback=lambda: broadcast_applications_update(),
-    new_app_callback=lambda company, position, stage: broadcast_new_application(company, position, stage)
-)
-
-def create_app(company, position, stage):
-    app_dict = {
-        "id": app_counter[0],
-        "company": company,
-        "position": position,
-        "stage": stage,
-        "date_added": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    app_counter[0] += 1
-    return app_dict
+def wire_tenant(tenant):
+    """Point a tenant's monitor broadcasts at that user's socket room"""
+    tenant.monitor.set_broadcast_callbacks(
+        broadcast_callback=lambda: broadcast_applications_update(tenant),
+        new_app_callback=lambda new_applications: broadcast_new_applications(tenant, new_applications)
+    )
+
+tenants = TenantRegistry(on_created=wire_tenant)
+
+def resolve_user_id(token=None):
+    """Browser requests carry the Flask session; the Streamlit server sends the token from the OAuth redirect"""
+    return session.get('user_id') or db.get_session_user(token or request.headers.get('X-Session-Token'))
+
+def current_tenant():
+    return tenants.get(resolve_user_id())
+
+def not_signed_in():
+    return jsonify({"error": "Not signed in"}), 401
+
+EMPTY_BOARD = {stage: [] for stage in STAGES}
 
 @app.route("/api/applications", methods=["GET"])
 def get_applications():
-    grouped = {"Applied": [], "Interview": [], "Offer": [], "Rejected": []}
-    for app in applications:
-        if (stage := app.get("stage", "Applied")) in grouped:
-            grouped[stage].append(app)
-    return jsonify(grouped)
+    if not (tenant := current_tenant()):
+        return jsonify(EMPTY_BOARD)
+    if any(arg in request.args for arg in _QUERY_ARGS):
+        return query_applications(tenant)
+    store = tenant.store
+    # Each board version is serialized (and compressed) once; polling clients mostly get a 304
+    gzipped = 'gzip' in request.accept_encodings
+    version, body = store.serialized(gzipped)
+    etag = f"{store.epoch}-{version}{'-gzip' if gzipped else ''}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['X-Board-Epoch'], response.headers['X-Board-Version'] = store.epoch, str(version)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+_QUERY_ARGS = ('stage', 'q', 'from', 'to', 'sort', 'cursor', 'limit')
+
+def query_applications(tenant):
+    """Filtered, sorted, cursor-paginated page served straight from the indexed applications table"""
+    if (stage := request.args.get('stage')) and stage not in STAGES:
+        return jsonify({"error": "Valid stage required"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        tenant.store.writer.flush()  # Stage changes may still be queued for the DB
+        page = db.query_applications(
+            tenant.user_id, stage=stage, search=request.args.get('q'),
+            date_from=request.args.get('from'), date_to=request.args.get('to'),
+            sort=request.args.get('sort', 'date_desc'), cursor=request.args.get('cursor'), limit=limit
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    page['counts'] = {s: page['counts'].get(s, 0) for s in STAGES}
+    return jsonify(page)
+
+@app.route("/api/applications/changes", methods=["GET"])
+def get_application_changes():
+    """Deltas since a board version; with ?timeout=N the request parks until something changes"""
+    if not (tenant := current_tenant()):
+        return not_signed_in()
+    store = tenant.store
+    try:
+        since = int(request.args['since'])
+        timeout = min(max(float(request.args.get('timeout', 0)), 0), float(os.getenv('LONG_POLL_MAX_SECONDS', 30)))
+    except (KeyError, ValueError):
+        return jsonify({"error": "Integer 'since' version required"}), 400
+    
+    epoch = request.args.get('epoch')
+    if (changes := store.changes_since(since, timeout) if epoch in (None, store.epoch) else None) is None:
+        return jsonify({"error": "Version is outside the change log, refetch the board", "resync_required": True, "epoch": store.epoch, "version": store.version}), 409
+    return jsonify({"epoch": store.epoch, "version": changes[-1]['version'] if changes else since, "changes": changes})
 
 @app.route("/api/applications", methods=["POST"])
 def add_application():
@@ -53,56 +110,41 @@ def add_application():
     if not data or not data.get("company") or not data.get("position"):
         return jsonify({"error": "Company and position are required"}), 400
     
-    company, position, stage = data["company"], data["position"], data.get("stage", "Applied")
-    existing = next((app for app in applications if 
-                    app["company"].lower() == company.lower() and 
-                    app["position"].lower() == position.lower()), None)
+    if not (tenant := current_tenant()):
+        return not_signed_in()
     
-    if existing:
-        existing.update({"stage": stage, "date_added": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
-        if current_user_id:
-            db.save_application(current_user_id, company, position, stage)
-        return jsonify({"message": "Application updated", "application": existing})
-    
-    new_app = create_app(company, position, stage)
-    applications.append(new_app)
-    if current_user_id:
-        db.save_application(current_user_id, company, position, stage)
+    company, position, stage = data["company"], data["position"], data.get("stage", "Applied")
+    app, created, _ = tenant.store.upsert(company, position, stage)
+    if not created:
+        return jsonify({"message": "Application updated", "application": app})
     
     # Broadcast real-time update
-    broadcast_applications_update()
-    return jsonify({"message": "Application added", "application": new_app})
+    broadcast_applications_update(tenant)
+    return jsonify({"message": "Application added", "application": app})
 
 @app.route("/api/applications/<int:app_id>", methods=["PUT"])
 def update_application(app_id):
     data = request.get_json()
-    if not (stage := data.get("stage")) or stage not in ["Applied", "Interview", "Offer", "Rejected"]:
+    if not (stage := data.get("stage")) or stage not in STAGES:
         return jsonify({"error": "Valid stage required"}), 400
     
-    if not (app := next((app for app in applications if app["id"] == app_id), None)):
+    if not (tenant := current_tenant()):
+        return not_signed_in()
+    if not (app := tenant.store.set_stage(app_id, stage)):
         return jsonify({"error": "Application not found"}), 404
     
-    app.update({"stage": stage, "date_added": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
-    if current_user_id:
-        db.save_application(current_user_id, app["company"], app["position"], stage)
-    
     # Broadcast real-time update
-    broadcast_applications_update()
+    broadcast_applications_update(tenant)
     return jsonify({"message": "Application updated", "application": app})
 
 @app.route("/api/applications/<int:app_id>", methods=["DELETE"])
 def delete_application(app_id):
-    global applications
-    applications = [app for app in applications if app["id"] != app_id]
-    if current_user_id:
-        try:
-            db.cursor.execute("DELETE FROM applications WHERE id=? AND user_id=?", (app_id, current_user_id))
-            db.conn.commit()
-        except:
-            pass
+    if not (tenant := current_tenant()):
+        return not_signed_in()
+    tenant.store.delete(app_id)
     
     # Broadcast real-time update
-    broadcast_applications_update()
+    broadcast_applications_update(tenant)
     return jsonify({"message": "Application deleted"})
 
 def error_page(title, message):
@@ -111,9 +153,7 @@ def error_page(title, message):
 @app.route("/api/gmail/auth-url", methods=["GET"])
 def get_gmail_auth_url():
     try:
-        if not (monitor := get_monitor()):
-            return jsonify({"error": "Email monitor not initialized"}), 500
-        return jsonify({"auth_url": auth_url}) if (auth_url := monitor.get_auth_url()) else (jsonify({"error": "Failed to get authorization URL"}), 500)
+        return jsonify({"auth_url": auth_url}) if (auth_url := GmailService().get_authorization_url()) else (jsonify({"error": "Failed to get authorization URL"}), 500)
     except:
         return jsonify({"error": "OAuth not configured"}), 500
 
@@ -125,59 +165,71 @@ def gmail_oauth_callback():
         return error_page("❌ OAuth Error", "No authorization code received")
     
     try:
-        if not (monitor := get_monitor()):
-            return error_page("❌ Error", "Email monitor not available")
-        
-        success, result = monitor.authenticate_with_code(auth_code)
+        # A fresh service per login, so concurrent sign-ins never share credentials
+        email_service = GmailService()
+        success, result = email_service.authenticate_with_code(auth_code)
         if success:
-            try:
-                import threading
-                global current_user_id
-                current_user_id = db.ensure_user(result)
-                monitor.set_current_user(current_user_id)  # Set user ID on monitor for DB operations
-                applications.clear()
-                loaded_apps = db.get_user_applications(current_user_id)
-                print(f"✅ Loaded {len(loaded_apps)} applications from DB for {result}")
-                for app in loaded_apps:
-                    print(f"  • {app['company']} - {app['position']} ({app['stage']})")
-                applications.extend(loaded_apps)
-                app_counter[0] = max([a['id'] for a in applications], default=0) + 1
-                monitor.set_applications_ref(applications, app_counter)
-                
-                # Re-establish broadcast callbacks after authentication
-                monitor.set_broadcast_callbacks(
-                    broadcast_callback=lambda: broadcast_applications_update(),
-                    new_app_callback=lambda company, position, stage: broadcast_new_application(company, position, stage)
-                )
-
-                threading.Timer(1.0, lambda: monitor.start_monitoring()).start()
-            except:
-                pass
-            return redirect(f'{os.getenv("FRONTEND_URL", "http://localhost")}:{os.getenv("FRONTEND_PORT", 8501)}?auth=success')
+            tenant = tenants.login(result, email_service)
+            session['user_id'] = tenant.user_id
+            # The URL only carries a single-use code; the frontend swaps it for a session token via POST
+            login_code = db.create_login_code(tenant.user_id)
+            print(f"✅ Loaded {len(tenant.store)} applications from DB for {result}")
+            threading.Timer(1.0, lambda: tenant.monitor.start_monitoring()).start()
+            return redirect(f'{os.getenv("FRONTEND_URL", "http://localhost")}:{os.getenv("FRONTEND_PORT", 8501)}?auth=success&code={login_code}')
         return error_page("❌ Authentication Failed", f"Error: {result}")
     except Exception as e:
         return error_page("❌ Authentication Error", f"Something went wrong: {str(e)}")
 
+@app.route("/api/auth/session", methods=["POST"])
+def redeem_login_code():
+    if not (token := db.redeem_login_code((request.get_json(silent=True) or {}).get('code'))):
+        return jsonify({"error": "Invalid or expired login code"}), 400
+    return jsonify({"token": token})
+
+@app.route("/api/auth/logout", methods=["POST"])
+def logout():
+    db.delete_session(request.headers.get('X-Session-Token'))
+    session.clear()
+    return jsonify({"message": "Signed out"})
+
 @app.route("/api/monitor/status", methods=["GET"])
 def get_monitor_status():
-    if monitor := get_monitor():
-        status = monitor.get_status()
-        status['total_applications'] = len(applications)
+    if tenant := current_tenant():
+        status = tenant.monitor.get_status()
+        status['total_applications'] = len(tenant.store)
+        status['fanout'] = fanout.stats()
+        status['tenants'] = tenants.stats()
         return jsonify(status)
-    return jsonify({'is_running': False, 'gmail_connected': False, 'gmail_email': None, 'gemini_available': False, 'processed_emails': 0, 'check_interval': 1, 'total_applications': len(applications)})
+    return jsonify({'is_running': False, 'gmail_connected': False, 'gmail_email': None, 'gemini_available': False, 'processed_emails': 0, 'check_interval': 1, 'total_applications': 0})
 
 @app.route("/api/monitor/scan", methods=["POST"])
 def manual_scan():
-    if (monitor := get_monitor()) and monitor.manual_scan():
-        # Broadcast update after manual scan in case new applications were found
-        broadcast_applications_update()
-        return jsonify({"message": "Manual scan completed"})
+    if (tenant := current_tenant()) and tenant.monitor.manual_scan():
+        # New applications are broadcast by the monitor pipeline as they are persisted
+        return jsonify({"message": "Manual scan triggered"})
     return jsonify({"error": "Manual scan failed or monitoring not running"}), 400
 
+@app.route("/api/gmail/push", methods=["POST"])
+def gmail_push():
+    """Gmail push notification, delivered by a Pub/Sub push subscription: poll that account right away"""
+    # The Pub/Sub subscription's push endpoint carries ?token=GMAIL_PUSH_TOKEN; without one configured, push is off
+    if not (push_token := os.getenv('GMAIL_PUSH_TOKEN')) or not secrets.compare_digest(request.args.get('token', ''), push_token):
+        return jsonify({"error": "Invalid push token"}), 403
+    try:
+        message = (request.get_json(silent=True) or {}).get('message', {})
+        notification = json.loads(base64.b64decode(message.get('data', '')))
+        email, history_id = notification['emailAddress'], notification.get('historyId')
+    except Exception:
+        return jsonify({"error": "Malformed push notification"}), 400
+    # Unknown accounts still get a 2xx, otherwise Pub/Sub keeps redelivering
+    if (user_id := db.get_user_id(email)) and (tenant := tenants.get(user_id)):
+        tenant.monitor.notify_push(history_id)
+    return "", 204
+
 @app.route("/api/monitor/stop", methods=["POST"])
 def stop_monitoring():
-    if monitor := get_monitor():
-        monitor.stop_monitoring()
+    if tenant := current_tenant():
+        tenant.monitor.stop_monitoring()
         return jsonify({"message": "Email monitoring stopped"})
     return jsonify({"error": "Monitor not available"}), 400
 
@@ -187,36 +239,32 @@ def analyze_email():
         data = request.get_json()
         if not (subject := data.get('email_subject', '')) and not (body := data.get('email_body', '')):
             return jsonify({"error": "Email subject or body is required"}), 400
+        if not (tenant := current_tenant()):
+            return not_signed_in()
         
         from utils.gemini_analyzer import GeminiEmailAnalyzer
-        result = GeminiEmailAnalyzer().analyze_email_for_interview_stage(subject, body, "")
+        # Reuse the monitors' shared analyzer so its in-process cache tier is shared
+        analyzer = tenant.monitor.analyzer or GeminiEmailAnalyzer()
+        result = analyzer.analyze_email_for_interview_stage(subject, body, "")
         
         company, job, stage, confidence = result.get('company_name'), result.get('job_title'), result.get('interview_stage'), result.get('confidence', 0)
         stage_map = {'application_received': 'Applied', 'phone_screen': 'Interview', 'technical_interview': 'Interview', 'behavioral_interview': 'Interview', 'final_interview': 'Interview', 'offer': 'Offer', 'rejected': 'Rejected'}
         dashboard_stage = stage_map.get(stage, 'Applied')
         
         if confidence >= 30 and company and job:
-            existing = next((app for app in applications if app["company"].lower() == company.lower() and app["position"].lower() == job.lower()), None)
+            _, created, changed = tenant.store.upsert(company, job, dashboard_stage, advance_only=True)
             
-            if not existing:
-                applications.append(create_app(company, job, dashboard_stage))
-                if current_user_id:
-                    db.save_application(current_user_id, company, job, dashboard_stage)
+            if created:
                 message = "Email analyzed and application added automatically"
                 # Broadcast real-time update for manual analysis
-                broadcast_new_application(company, job, dashboard_stage)
-                broadcast_applications_update()
+                broadcast_new_applications(tenant, [{'company': company, 'position': job, 'stage': dashboard_stage}])
+                broadcast_applications_update(tenant)
+            elif changed:
+                message = "Email analyzed and existing application updated"
+                # Broadcast real-time update for manual analysis
+                broadcast_applications_update(tenant)
             else:
-                stage_order = ['Applied', 'Interview', 'Offer', 'Rejected']
-                if stage_order.index(dashboard_stage) > stage_order.index(existing.get('stage', 'Applied')) or dashboard_stage == 'Rejected':
-                    existing.update({'stage': dashboard_stage, 'date_added': datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
-                    if current_user_id:
-                        db.save_application(current_user_id, company, job, dashboard_stage)
-                    message = "Email analyzed and existing application updated"
-                    # Broadcast real-time update for manual analysis
-                    broadcast_applications_update()
-                else:
-                    message = "Email analyzed but no update needed"
+                message = "Email analyzed but no update needed"
             
             return jsonify({"message": message, "analysis": result, "added_to_dashboard": True})
         
@@ -232,42 +280,73 @@ def health_check():
     return jsonify({"status": "healthy"})
 
 # WebSocket events for real-time updates
+# Protocol: 'board_snapshot' {epoch, seq, board} on connect or resync, then one 'application_changed'
+# {epoch, seq, op, application | id} per mutation with seq = board version. A client that sees a seq
+# other than last + 1 (or a new epoch) emits 'resync' and gets a fresh snapshot. Events go through
+# the fan-out worker to the user's room and must be acknowledged; 'resync_required' means the
+# client's buffer overflowed and it should resync too.
+def board_snapshot(tenant):
+    if not tenant:
+        return {'epoch': None, 'seq': 0, 'board': EMPTY_BOARD}
+    version, board = tenant.store.board()
+    return {'epoch': tenant.store.epoch, 'seq': version, 'board': board}
+
+def user_room(user_id):
+    return f"user:{user_id or 'guest'}"
+
 @socketio.on('connect')
-def handle_connect():
-    print('Client connected for real-time updates')
+def handle_connect(auth=None):
+    # Socket sessions outlive the handshake, so remember who this socket belongs to
+    user_id = session['user_id'] = resolve_user_id((auth or {}).get('token'))
+    print(f'Client connected for real-time updates ({user_room(user_id)})')
+    fanout.add_client(request.sid, user_room(user_id))
     emit('status', {'message': 'Connected to real-time updates'})
+    fanout.send(request.sid, 'board_snapshot', board_snapshot(tenants.get(user_id)))
+
+@socketio.on('resync')
+def handle_resync(data=None):
+    print('Client requested a board resync')
+    fanout.send(request.sid, 'board_snapshot', board_snapshot(tenants.get(session.get('user_id'))), reset=True)
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    fanout.remove_client(request.sid)
     print('Client disconnected from real-time updates')
 
-def broadcast_applications_update():
-    """Broadcast application updates to all connected clients"""
+def broadcast_applications_update(tenant):
+    """Emit every change not yet broadcast to the tenant's sockets; safe to call repeatedly, each change goes out once"""
     try:
-        grouped = {"Applied": [], "Interview": [], "Offer": [], "Rejected": []}
-        for app in applications:
-            if (stage := app.get("stage", "Applied")) in grouped:
-                grouped[stage].append(app)
-        socketio.emit('applications_updated', grouped)
-        print(f"📡 Broadcasted application update to connected clients")
+        store, room = tenant.store, user_room(tenant.user_id)
+        with tenant.broadcast_lock:
+            if (changes := store.changes_since(tenant.broadcast_version)) is None:
+                # Fell out of the change log (or the board was reloaded): everyone gets a snapshot
+                snapshot = board_snapshot(tenant)
+                fanout.publish(room, 'board_snapshot', snapshot)
+                tenant.broadcast_version = snapshot['seq']
+                print(f"📡 Broadcasted board snapshot to connected clients")
+                return
+            for change in changes:
+                fanout.publish(room, 'application_changed', {'epoch': store.epoch, 'seq': change['version'], **{k: v for k, v in change.items() if k != 'version'}})
+            if changes:
+                tenant.broadcast_version = changes[-1]['version']
+                print(f"📡 Broadcasted {len(changes)} application change(s) to connected clients")
     except Exception as e:
         print(f"❌ Error broadcasting update: {e}")
 
-def broadcast_new_application(company, position, stage):
-    """Broadcast when a new application is detected from email"""
+def broadcast_new_applications(tenant, new_applications):
+    """Broadcast one merged toast for the applications detected from email in a coalescing window"""
     try:
-        socketio.emit('new_application_detected', {
-            'company': company,
-            'position': position, 
-            'stage': stage,
+        fanout.publish(user_room(tenant.user_id), 'new_application_detected', {
+            'applications': new_applications,
+            'count': len(new_applications),
             'timestamp': datetime.now().isoformat()
         })
-        print(f"🔔 Broadcasted new application: {company} - {position} ({stage})")
+        print(f"🔔 Broadcasted {len(new_applications)} new application(s): {', '.join(a['company'] for a in new_applications)}")
     except Exception as e:
         print(f"❌ Error broadcasting new application: {e}")
 
 if __name__ == "__main__":
-    if missing := [v for v in ['GMAIL_CLIENT_ID', 'GMAIL_CLIENT_SECRET', 'GEMINI_API_KEY'] if not os.getenv(v) or os.getenv(v).strip() in ['', "''"]]:
+    if missing := [v for v in ['GMAIL_CLIENT_ID', 'GMAIL_CLIENT_SECRET', 'GEMINI_API_KEY', 'FLASK_SECRET_KEY'] if not os.getenv(v) or os.getenv(v).strip() in ['', "''"]]:
         print(f"❌ Missing environment variables: {', '.join(missing)}\n💡 Set all required variables in .env file")
         exit(1)
     
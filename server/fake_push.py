@@ -0,0 +1,37 @@
+"""Local stand-in for Gmail's Pub/Sub push: POSTs a fake mailbox-change notification to the backend.
+
+Usage: python fake_push.py you@gmail.com [history_id]
+The backend only accepts pushes when GMAIL_PUSH_TOKEN is set; this script sends the same value.
+"""
+import base64
+import json
+import os
+import sys
+import time
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def send_push(email, history_id=None):
+    notification = {'emailAddress': email, **({'historyId': int(history_id)} if history_id else {})}
+    body = {
+        'message': {
+            'data': base64.b64encode(json.dumps(notification).encode()).decode(),
+            'messageId': str(time.time_ns()),
+            'publishTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        },
+        'subscription': 'projects/local/subscriptions/fake-gmail-push'
+    }
+    url = f'{os.getenv("BACKEND_URL", "http://localhost")}:{os.getenv("BACKEND_PORT", "5000")}/api/gmail/push'
+    response = requests.post(url, json=body, params={'token': os.getenv('GMAIL_PUSH_TOKEN', '')})
+    print(f"📨 Push for {email} -> {response.status_code}")
+    return response.status_code
+
+
+if __name__ == "__main__":
+    if not 2 <= len(sys.argv) <= 3:
+        print(__doc__)
+        exit(1)
+    exit(0 if send_push(*sys.argv[1:]) < 300 else 1)
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+
+try:
+    from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+    _RATE_LIMIT_ERRORS = (ResourceExhausted, TooManyRequests)
+except ImportError:
+    _RATE_LIMIT_ERRORS = ()
+
+
+def is_rate_limit_error(error):
+    return isinstance(error, _RATE_LIMIT_ERRORS) or '429' in str(error) or 'resource exhausted' in str(error).lower()
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AnalysisExecutor:
+    """Governs model calls made by the analyze-stage workers (max_workers of them): a quota-matched
+    token bucket plus AIMD concurrency that halves the in-flight limit on 429s and creeps back up."""
+
+    def __init__(self, max_workers=None, requests_per_minute=None, max_retries=3):
+        self.max_workers = max_workers or int(os.getenv('GEMINI_WORKERS', 4))
+        requests_per_minute = requests_per_minute or float(os.getenv('GEMINI_REQUESTS_PER_MINUTE', 15))
+        self.bucket = TokenBucket(requests_per_minute / 60, max(1, min(self.max_workers, requests_per_minute)))
+        self.max_retries = max_retries
+        self.concurrency_limit = self.max_workers
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._successes = 0
+        self.rate_limited = 0
+        self.requests = 0
+
+    def call(self, fn, *args, **kwargs):
+        """Run one model request under the concurrency limit and token bucket, retrying rate-limit errors"""
+        for attempt in range(self.max_retries + 1):
+            with self._cond:
+                while self._in_flight >= self.concurrency_limit:
+                    self._cond.wait()
+                self._in_flight += 1
+            try:
+                self.bucket.acquire()
+                self.requests += 1
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self._on_rate_limited()
+                time.sleep(min(30, 2 ** (attempt + 1)))
+                continue
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+            self._on_success()
+            return result
+
+    def _on_rate_limited(self):
+        with self._cond:
+            self.rate_limited += 1
+            self._successes = 0
+            self.concurrency_limit = max(1, self.concurrency_limit // 2)
+        print(f"⚠️ Gemini rate limited, concurrency reduced to {self.concurrency_limit}")
+
+    def _on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= 20 and self.concurrency_limit < self.max_workers:
+                self._successes = 0
+                self.concurrency_limit += 1
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'concurrency_limit': self.concurrency_limit,
+                'in_flight': self._in_flight,
+                'requests': self.requests,
+                'rate_limited': self.rate_limited
+            }
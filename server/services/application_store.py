@@ -0,0 +1,190 @@
+import gzip
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from utils import db
+from utils.db import normalize_key
+from utils.write_behind import get_writer
+
+STAGES = ['Applied', 'Interview', 'Offer', 'Rejected']
+
+
+class ApplicationStore:
+    """The job board shared by the Flask routes and the email monitor. Every read and write goes
+    through one lock, and applications are indexed by id, normalized (company, position) and stage so
+    lookups, upserts and deletes stay O(1). Callers get copies, never the stored dicts.
+
+    Once bound to a user the DB is the authority and this is a write-through cache keyed by DB id:
+    new applications wait for their row id, while stage changes and deletes go through the shared
+    write-behind queue. Unbound, the board lives in memory only.
+
+    `version` goes up on every mutation; the grouped board and its serialized forms are built at most
+    once per version. `epoch` changes per process so (epoch, version) never repeats across restarts.
+    The last CHANGE_LOG_SIZE mutations are kept as an ordered change log for delta readers."""
+
+    def __init__(self, applications=None):
+        self._lock = threading.RLock()
+        self.user_id = None
+        self.writer = get_writer()
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._views, self._views_version = {}, None
+        self._changed = threading.Condition(self._lock)
+        self._log = deque(maxlen=int(os.getenv('CHANGE_LOG_SIZE', 1000)))
+        self._log_start = 0  # Every change after this version is still in the log
+        self.load(applications or [])
+
+    def load(self, applications):
+        """Replace the board without touching the DB"""
+        with self._lock:
+            self._by_id, self._by_key, self._by_stage = {}, {}, {stage: {} for stage in STAGES}
+            for app in applications:
+                self._insert(dict(app))
+            self._next_local_id = max(self._by_id, default=0) + 1
+            self.version += 1
+            # A reload isn't expressible as deltas, so readers behind this point must resync
+            self._log.clear()
+            self._log_start = self.version
+            self._changed.notify_all()
+
+    def bind(self, user_id):
+        """Make user_id's rows the board, reading back any writes still queued first"""
+        with self._lock:
+            self.writer.flush()
+            self.load(db.get_user_applications(user_id))
+            self.user_id = user_id
+            return len(self._by_id)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, app_id):
+        with self._lock:
+            return dict(app) if (app := self._by_id.get(app_id)) else None
+
+    def find(self, company, position):
+        with self._lock:
+            return dict(self._by_id[app_id]) if (app_id := self._by_key.get(self._key(company, position))) else None
+
+    def all(self):
+        with self._lock:
+            return [dict(app) for app in self._by_id.values()]
+
+    def grouped(self):
+        """Board view: stage -> applications in that stage"""
+        with self._lock:
+            return {stage: [dict(app) for app in self._by_stage[stage].values()] for stage in STAGES}
+
+    def board(self):
+        """(version, grouped board) shared by every caller until the next mutation; treat it as read-only"""
+        return self._view('grouped', self.grouped)
+
+    def serialized(self, gzipped=False):
+        """(version, board as JSON bytes), optionally gzip-compressed"""
+        if gzipped:
+            return self._view('gzip', lambda: gzip.compress(self.serialized()[1], compresslevel=6))
+        return self._view('json', lambda: json.dumps(self.board()[1], separators=(',', ':')).encode())
+
+    def changes_since(self, since, timeout=0):
+        """Ordered changes after version `since`, waiting up to timeout seconds for one to arrive.
+        Returns None when `since` is outside the change log and the caller has to refetch the board."""
+        with self._changed:
+            if since < self._log_start or since > self.version:
+                return None
+            if timeout:
+                self._changed.wait_for(lambda: self.version > since or since < self._log_start, timeout)
+                if since < self._log_start:
+                    return None
+            return list(islice(self._log, len(self._log) - (self.version - since), None))
+
+    def _record(self, op, app):
+        """Bump the version and log the change; callers hold the lock"""
+        self.version += 1
+        if len(self._log) == self._log.maxlen:
+            self._log_start = self._log[0]['version']
+        self._log.append({"version": self.version, "op": op, **({"application": dict(app)} if op == 'upsert' else {"id": app['id']})})
+        self._changed.notify_all()
+
+    def _view(self, kind, build):
+        with self._lock:
+            if self._views_version != self.version:
+                self._views, self._views_version = {}, self.version
+            if kind not in self._views:
+                self._views[kind] = build()
+            return self.version, self._views[kind]
+
+    def upsert(self, company, position, stage, advance_only=False):
+        """Add the application or move it to `stage` atomically; returns (application, created, changed).
+        With advance_only, an existing application only moves forward through STAGES (or to Rejected)."""
+        with self._lock:
+            if (app_id := self._by_key.get(self._key(company, position))) is None:
+                app = {"id": self._create_id(company, position, stage), "company": company, "position": position, "stage": stage, "date_added": self._now()}
+                self._insert(app)
+                self._record('upsert', app)
+                return dict(app), True, True
+            app = self._by_id[app_id]
+            if advance_only and not self._is_advance(app.get('stage', 'Applied'), stage):
+                return dict(app), False, False
+            changed = self._move(app, stage)
+            return dict(app), False, changed
+
+    def set_stage(self, app_id, stage):
+        """Move an application to `stage`; returns the updated application or None if it doesn't exist"""
+        with self._lock:
+            if not (app := self._by_id.get(app_id)):
+                return None
+            self._move(app, stage)
+            return dict(app)
+
+    def delete(self, app_id):
+        """Remove an application; returns it, or None if it doesn't exist"""
+        with self._lock:
+            if not (app := self._by_id.pop(app_id, None)):
+                return None
+            self._by_key.pop(self._key(app['company'], app['position']), None)
+            self._by_stage.get(app.get('stage'), {}).pop(app_id, None)
+            self._record('delete', app)
+            if self.user_id:
+                self.writer.delete_application(self.user_id, app_id)
+            return app
+
+    def _create_id(self, company, position, stage):
+        if self.user_id:
+            # The row id is the application id, so a new row is committed before it enters the cache
+            return self.writer.save_application(self.user_id, company, position, stage, urgent=True).result()
+        app_id, self._next_local_id = self._next_local_id, self._next_local_id + 1
+        return app_id
+
+    def _insert(self, app):
+        self._by_id[app['id']] = app
+        self._by_key[self._key(app['company'], app['position'])] = app['id']
+        self._by_stage.setdefault(app.get('stage'), {})[app['id']] = app
+
+    def _move(self, app, stage):
+        if stage == app.get('stage'):
+            return False
+        self._by_stage.get(app.get('stage'), {}).pop(app['id'], None)
+        app.update({"stage": stage, "date_added": self._now()})
+        self._by_stage.setdefault(stage, {})[app['id']] = app
+        self._record('upsert', app)
+        if self.user_id:
+            self.writer.save_application(self.user_id, app['company'], app['position'], stage)
+        return True
+
+    @staticmethod
+    def _is_advance(current, stage):
+        if stage == 'Rejected':
+            return True
+        return current in STAGES and stage in STAGES and STAGES.index(stage) > STAGES.index(current)
+
+    @staticmethod
+    def _key(company, position):
+        return normalize_key(company), normalize_key(position)
+
+    @staticmethod
+    def _now():
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
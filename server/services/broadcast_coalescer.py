@@ -0,0 +1,55 @@
+import os
+import threading
+
+
+class BroadcastCoalescer:
+    """Collects change notifications and hands them to `emit(new_applications)` at most once per
+    window. The first notification in a quiet period arms the timer; everything arriving before it
+    fires rides along, so a burst of N emails costs one board broadcast and one merged toast."""
+
+    def __init__(self, emit, window=None):
+        self.emit = emit
+        self.window = window if window is not None else float(os.getenv('BROADCAST_WINDOW_MS', 500)) / 1000
+        self._lock = threading.Lock()
+        self._timer = None
+        self._new_applications = []
+        self.notifications = 0
+        self.emits = 0
+
+    def notify(self, new_application=None):
+        """Mark the board dirty, optionally recording a newly detected application for the next toast"""
+        with self._lock:
+            self.notifications += 1
+            if new_application:
+                self._new_applications.append(new_application)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self._fire)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Emit anything pending right away, e.g. on shutdown"""
+        with self._lock:
+            if self._timer is None:
+                return
+            self._timer.cancel()
+        self._fire()
+
+    def _fire(self):
+        with self._lock:
+            if self._timer is None:
+                return
+            self._timer = None
+            new_applications, self._new_applications = self._new_applications, []
+            self.emits += 1
+        try:
+            self.emit(new_applications)
+        except Exception as e:
+            print(f"❌ Error broadcasting coalesced update: {e}")
+
+    def stats(self):
+        return {
+            'notifications': self.notifications,
+            'emits': self.emits,
+            'window_ms': round(self.window * 1000)
+        }
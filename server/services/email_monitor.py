@@ -1,41 +1,66 @@
+import queue
 import threading
 import time
 from .email_service import GmailService
+from .analysis_pool import AnalysisExecutor
+from .pipeline import IngestionPipeline, PipelineStage
+from .poll_scheduler import get_scheduler
+from .application_store import ApplicationStore
+from .broadcast_coalescer import BroadcastCoalescer
+from .housekeeping import get_housekeeping
 import os
-from datetime import datetime
+from utils.pre_classifier import extract_features
+from utils.ats_parsers import parse_known_template, detect_stage
 
 try:
     from utils.gemini_analyzer import GeminiEmailAnalyzer
 except ImportError:
     GeminiEmailAnalyzer = None
 
+_TERMINAL_STAGES = {'rejected', 'offer'}
+
 class EmailMonitor:
     
-    def __init__(self, applications_list=None):
-        self.email_service = GmailService()
+    def __init__(self, store=None, email_service=None):
+        self.email_service = email_service or GmailService()
         self.is_running = False
-        self.monitor_thread = None
         self.check_interval = 1
         self.processed_emails = 0
-        self.applications = applications_list or []
-        self.app_counter_ref = None
+        self.store = store if store is not None else ApplicationStore()
         self.consecutive_errors = 0
         self.last_activity_time = 0
         self.dynamic_interval = 1  # Start with 1 second
+        self.min_interval = float(os.getenv('POLL_MIN_INTERVAL', 0.5))
+        self.max_interval = float(os.getenv('POLL_MAX_INTERVAL', 5))
+        self.push_topic = os.getenv('GMAIL_PUSH_TOPIC')
+        self.push_fallback_interval = float(os.getenv('GMAIL_PUSH_FALLBACK_INTERVAL', 300))
+        self.push_ready = False  # A Gmail watch is registered, so idle polling is only a safety net
+        self.watch_expiration = 0
+        self.push_notifications = 0
+        self.retry_delay = float(os.getenv('ANALYSIS_RETRY_SECONDS', 300))
+        self.last_retry_time = 0
         self.broadcast_callback = None  # Will be set by app.py
-        self.new_app_callback = None   # Will be set by app.py
+        self.new_app_callback = None   # Will be set by app.py; receives a list of new applications
+        self.broadcaster = BroadcastCoalescer(self._emit_broadcast)
         self.current_user_id = None    # Will be set when user authenticates
+        self.housekeeping = get_housekeeping()
+        self.pre_classifier = self.housekeeping.pre_classifier  # Shared by every account
+        self.template_match_confidence = int(os.getenv('ATS_MATCH_CONFIDENCE', 90))
+        self.template_matches = 0
+        self.thread_matches = 0
+        self.pipeline = None
+        self.scheduler = get_scheduler()
+        self.shutdown_timeout = float(os.getenv('PIPELINE_SHUTDOWN_TIMEOUT', 30))
+        self._in_pipeline = 0  # Items this monitor has in the shared pipeline
+        self._drained = threading.Condition()
+        self.queued_history_id = None
+        self.fetched_emails = 0
+        self.fetch_latency = 0
         
-        self.analyzer = None
-        if GeminiEmailAnalyzer and os.getenv('GEMINI_API_KEY'):
-            try:
-                self.analyzer = GeminiEmailAnalyzer()
-            except:
-                pass
+        self.analysis_executor, self.analyzer = shared_analysis()
     
-    def set_applications_ref(self, applications_list, app_counter_ref):
-        self.applications = applications_list
-        self.app_counter_ref = app_counter_ref
+    def set_store(self, store):
+        self.store = store
         
     def set_broadcast_callbacks(self, broadcast_callback, new_app_callback):
         """Set callbacks for real-time broadcasting"""
@@ -45,6 +70,16 @@ class EmailMonitor:
     def set_current_user(self, user_id):
         """Set the current user ID for database operations"""
         self.current_user_id = user_id
+        self.email_service.user_id = user_id
+        try:
+            from utils import db
+            self.email_service.history_id = self.queued_history_id = db.get_history_id(user_id)
+        except Exception as e:
+            print(f"❌ Failed to load Gmail sync checkpoint: {e}")
+        try:
+            print(f"✅ Loaded {self.store.bind(user_id)} applications from DB")
+        except Exception as e:
+            print(f"❌ Failed to load applications: {e}")
         
     def get_auth_url(self):
         return self.email_service.get_authorization_url()
@@ -55,68 +90,256 @@ class EmailMonitor:
     def start_monitoring(self):
         if self.is_running or not self.email_service.is_authenticated():
             return self.is_running
-        try:
-            recent_msgs = self.email_service.list_messages(max_results=50)
-            self.email_service.processed_emails.update({m['id'] for m in recent_msgs})
-        except:
-            pass
 
+        self.pipeline = shared_pipeline()
         self.is_running = True
-        self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
-        self.monitor_thread.start()
+        self.scheduler.add(self)
         return True
     
-    def stop_monitoring(self):
+    def stop_monitoring(self, wait=False):
+        """Stop scheduling polls right away; emails already fetched drain in the background unless wait is set"""
         self.is_running = False
-        if self.monitor_thread and self.monitor_thread.is_alive():
-            self.monitor_thread.join(timeout=2)
-    
-    def _monitor_loop(self):
-        while self.is_running:
+        self.scheduler.remove(self, timeout=0)
+        if wait:
+            self._drain()
+        else:
+            threading.Thread(target=self._drain, daemon=True).start()
+
+    def _drain(self):
+        """Let emails already fetched finish analysis and persistence, all within one shutdown_timeout"""
+        deadline = time.monotonic() + self.shutdown_timeout
+        self.scheduler.remove(self, timeout=self.shutdown_timeout)  # A poll in progress may still enqueue
+        with self._drained:
+            if not self._drained.wait_for(lambda: self._in_pipeline == 0, max(0, deadline - time.monotonic())):
+                print("⚠️ Ingestion pipeline did not drain before the shutdown timeout")
+        self.broadcaster.flush()
+        try:
+            from utils.write_behind import get_writer
+            get_writer().flush(timeout=max(0.1, deadline - time.monotonic()))
+        except Exception as e:
+            print(f"❌ Failed to flush pending writes: {e}")
+
+    def poll_once(self):
+        """Fetch stage, run by the shared scheduler: hand new emails to the pipeline without waiting
+        for analysis and return the seconds until this account should be polled again"""
+        if not self.is_running:
+            return None
+        try:
+            self.housekeeping.run_if_due()
+            self._renew_watch()
+            started = time.perf_counter()
+            emails = self.email_service.sync_new_emails(max_results=10) + self._retry_failed()
+            self.fetch_latency = time.perf_counter() - started
+            self.fetched_emails += len(emails)
+            for email in emails:
+                self._enqueue({'kind': 'email', 'email': email})
+            if self.email_service.history_id != self.queued_history_id:
+                # Saved by the persist stage once every email fetched before it has been ledgered
+                self.queued_history_id = self.email_service.history_id
+                self._enqueue({'kind': 'checkpoint', 'history_id': self.queued_history_id})
+            self.consecutive_errors = 0
+            
+            # Smart polling: fast while mail is arriving, doubling while idle. With push notifications
+            # arriving, new mail wakes the poll directly and the idle interval can grow long. A burst
+            # over the per-poll cap leaves a backlog that is drained a page per turn, between other accounts
+            if emails or self.email_service.has_backlog:
+                self.last_activity_time = time.time()
+                self.dynamic_interval = self.min_interval
+                print(f"⚡ Fetched {len(emails)} emails, using fast polling ({self.min_interval}s)")
+            else:
+                self.dynamic_interval = min(self.dynamic_interval * 2, self.push_fallback_interval if self.push_ready else self.max_interval)
+            return self.dynamic_interval
+        except Exception as e:
+            self.consecutive_errors += 1
+            return min(60, 10 * (2 ** min(self.consecutive_errors - 1, 3)))
+
+    def _enqueue(self, item):
+        """Blocking hand-off to the pipeline; a full queue pauses polling (backpressure)"""
+        item['monitor'] = self
+        with self._drained:
+            self._in_pipeline += 1
+        while True:
             try:
-                emails_processed = self._check_emails()
-                self.consecutive_errors = 0
-                
-                # Smart polling: adjust interval based on activity
-                if emails_processed > 0:
-                    self.last_activity_time = time.time()
-                    self.dynamic_interval = 0.5  # Very fast when emails are being processed
-                    print(f"⚡ Processed {emails_processed} emails, using fast polling (0.5s)")
+                self.pipeline.put(item, timeout=1)
+                return
+            except queue.Full:
+                if not self.is_running:
+                    self._finished(1)
+                    raise
+
+    def _finished(self, count):
+        """Items left the shared pipeline"""
+        with self._drained:
+            self._in_pipeline -= count
+            self._drained.notify_all()
+
+    def _extract_stage(self, items):
+        """Local routing: thread affinity, ATS templates and the pre-classifier decide what needs the model"""
+        emails = [item['email'] for item in items if item['kind'] == 'email']
+        linked = self._linked_threads(emails)
+        for item in items:
+            if item['kind'] != 'email':
+                continue
+            email = item['email']
+            email['features'] = extract_features(email)
+            if app := linked.get(email.get('thread_id')):
+                # A phrase match may only advance a thread locally; rejections and offers are final, so the model confirms them
+                if (stage := detect_stage(f"{email['subject']}\n{email['body']}")) and stage not in _TERMINAL_STAGES:
+                    item['result'] = self._thread_result(app, {'interview_stage': stage, 'confidence': 80})
                 else:
-                    time_since_activity = time.time() - self.last_activity_time
-                    if time_since_activity < 30:  # Active period
-                        self.dynamic_interval = 1  # Fast polling for 30s after activity
-                    elif time_since_activity < 120:  # Medium quiet period
-                        self.dynamic_interval = 2  # Medium polling for next 2 minutes
-                    else:  # Long quiet period
-                        self.dynamic_interval = min(5, self.check_interval)  # Slower polling
-                
-                time.sleep(self.dynamic_interval)
-                
-            except Exception as e:
-                self.consecutive_errors += 1
-                wait_time = min(60, 10 * (2 ** min(self.consecutive_errors - 1, 3)))
-                time.sleep(wait_time)
-    
-    def _check_emails(self):
-        emails = self.email_service.get_recent_emails(max_results=10)
-        emails_processed = 0
-        for email in emails:
-            if not self.is_running:
-                break
-            if self._process_email(email):
-                emails_processed += 1
+                    item['thread_app'] = app
+            elif (result := parse_known_template(email)) and result['confidence'] >= self.template_match_confidence:
+                item['result'] = result
+            elif self.analyzer and self.pre_classifier.should_skip(email['features']):
+                print(f"⏭️ Pre-classifier skipped: {email['subject'][:50]}...")
+                item['outcome'] = 'preclassified_negative'
+        return items
+
+    def _analyze_stage(self, items):
+        """Model calls for whatever the extract stage could not settle locally, batched per worker"""
+        pending = []
+        for item in items:
+            if item['kind'] != 'email' or 'result' in item or 'outcome' in item or not self.analyzer:
+                continue
+            email = item['email']
+            if app := item.get('thread_app'):
+                classified = self.analyzer.classify_stage(email['subject'], email['body'], app['company'], app['position'])
+                if not classified.get('error'):
+                    item['result'] = self._thread_result(app, classified)
+                    continue
+            pending.append(item)
+
+        if len(pending) > 1:
+            results = self.analyzer.analyze_batch([item['email'] for item in pending])
+            for item in pending:
+                if (result := results.get(item['email']['id'])) is not None:
+                    item['result'] = result
+        elif pending:
+            email = pending[0]['email']
+            pending[0]['result'] = self.analyzer.analyze_email_for_interview_stage(email['subject'], email['body'], email.get('sender', ''))
+        return items
+
+    def _persist_stage(self, items):
+        """Apply results to applications and the ledger strictly in arrival order"""
+        for item in items:
+            if item['kind'] == 'checkpoint':
+                self._save_sync_checkpoint(item['history_id'])
+                continue
+            email, result = item['email'], item.get('result')
             self.processed_emails += 1
-        return emails_processed
+            if outcome := item.get('outcome'):
+                self._record_outcome(email, outcome, version='pre-classifier')
+            elif result is not None:
+                if result.get('source') == 'thread':
+                    self.thread_matches += 1
+                elif str(result.get('source', '')).startswith('ats:'):
+                    self.template_matches += 1
+                item['outcome'], item['application'] = self._apply_result(email, result)
+                self._record_outcome(email, item['outcome'], version=result.get('source'))
+            elif self.analyzer:
+                item['outcome'] = 'error'
+                self._record_outcome(email, 'error')
+        return items
+
+    def _notify_stage(self, items):
+        for item in items:
+            if item.get('outcome') == 'added':
+                company, position, stage = item['application']
+                self.broadcaster.notify({'company': company, 'position': position, 'stage': stage})
+            elif item.get('outcome') == 'updated':
+                self.broadcaster.notify()
+        return items
+
+    def _emit_broadcast(self, new_applications):
+        """One coalesced window: a merged new-application toast, then a single board broadcast"""
+        if new_applications and self.new_app_callback:
+            self.new_app_callback(new_applications)
+        if self.broadcast_callback:
+            self.broadcast_callback()
+
+    def _save_sync_checkpoint(self, history_id):
+        if not self.current_user_id or not history_id:
+            return
+        try:
+            from utils.write_behind import get_writer
+            # Queued behind this batch's application and ledger writes, so it never commits ahead of them
+            get_writer().save_history_id(self.current_user_id, history_id)
+        except Exception as e:
+            print(f"❌ Failed to save Gmail sync checkpoint: {e}")
     
-    def _process_email(self, email):
-        if not self.analyzer:
-            return False
-        
+    def _retry_failed(self):
+        """Refetch a few messages whose analysis errored (429s, network) once their backoff has elapsed"""
+        if not self.current_user_id or time.time() - self.last_retry_time < self.retry_delay:
+            return []
+        self.last_retry_time = time.time()
+        try:
+            from utils import db
+            if message_ids := db.get_failed_message_ids(self.current_user_id, limit=10):
+                print(f"🔁 Retrying analysis of {len(message_ids)} message(s)")
+                return self.email_service.fetch_messages(message_ids)
+        except Exception as e:
+            print(f"❌ Failed to retry errored messages: {e}")
+        return []
+
+    def _renew_watch(self):
+        """Keep the Gmail push watch alive; Gmail expires watches after 7 days"""
+        if not self.push_topic or self.watch_expiration - time.time() > 86400:
+            return
+        if expiration := self.email_service.watch(self.push_topic):
+            self.watch_expiration, self.push_ready = expiration, True
+            print(f"📬 Gmail push notifications registered for {self.push_topic}")
+        else:
+            # Without a live watch new mail only shows up by polling, so fall back to the short idle interval
+            self.push_ready = False
+            self.dynamic_interval = min(self.dynamic_interval, self.max_interval)
+            self.watch_expiration = time.time() + 3600 - 86400  # Retry in an hour
+
+    def _linked_threads(self, emails):
+        """Thread id -> application for emails on threads that already produced an application"""
+        if not self.current_user_id or not emails:
+            return {}
+        try:
+            from utils import db
+            return db.get_thread_applications(self.current_user_id, {e['thread_id'] for e in emails if e.get('thread_id')})
+        except Exception as e:
+            print(f"❌ Failed to look up thread index: {e}")
+            return {}
+
+    @staticmethod
+    def _thread_result(app, classified):
+        # A follow-up without a recognisable stage keeps the application where it is
+        return {
+            'company_name': app['company'], 'job_title': app['position'],
+            'interview_stage': classified['interview_stage'] or 'application_received',
+            'confidence': classified['confidence'] if classified['interview_stage'] else 100,
+            'source': 'thread'
+        }
+
+    def _record_outcome(self, email, outcome, version=None):
+        """Persist the analysis outcome so the message is never re-analyzed after a restart.
+        Errors are ledgered too, but stay unseen so _retry_failed picks them up again"""
+        if outcome == 'error':
+            self.email_service.forget(email['id'])
+        if not self.current_user_id:
+            return
+        try:
+            from utils.write_behind import get_writer
+            writer = get_writer()
+            writer.record_processed_messages(self.current_user_id, [(email['id'], outcome, version or self.analyzer.VERSION)])
+            if outcome in ('added', 'updated', 'low_confidence') and version != 'thread':
+                # Model verdicts double as training labels for the pre-classifier
+                features = email.get('features') or extract_features(email)
+                is_job = outcome != 'low_confidence'
+                writer.save_email_label(self.current_user_id, email['id'], features, int(is_job))
+                self.pre_classifier.report_shadow_result(features, is_job)
+                self.housekeeping.label_added()
+        except Exception as e:
+            print(f"❌ Failed to record processed message: {e}")
+
+    def _apply_result(self, email, result):
         try:
-            result = self.analyzer.analyze_email_for_interview_stage(
-                email['subject'], email['body'], email.get('sender', '')
-            )
+            if result.get('error'):
+                return 'error', None
             
             stage_mapping = {
                 'application_received': 'Applied', 'phone_screen': 'Interview',
@@ -131,73 +354,55 @@ class EmailMonitor:
                 stage = stage_mapping.get(result.get('interview_stage'), 'Applied')
                 
                 was_added = self._add_or_update_application(company, position, stage)
+                self._link_thread(email, company, position)
                 
                 if was_added:
                     print(f"🎉 NEW APPLICATION from email: {company} - {position} ({stage})")
-                    # Trigger real-time notifications
-                    if self.new_app_callback:
-                        self.new_app_callback(company, position, stage)
-                    if self.broadcast_callback:
-                        self.broadcast_callback()
-                    return True
-                else:
-                    print(f"✅ Updated application from email: {email['subject'][:50]}...")
-                    if self.broadcast_callback:
-                        self.broadcast_callback()
-                    return True
-            else:
-                print(f"📧 Analyzed email: {email['subject'][:50]}... (not added - confidence: {confidence}%)")
-                return False
+                    return 'added', (company, position, stage)
+                print(f"✅ Updated application from email: {email['subject'][:50]}...")
+                return 'updated', (company, position, stage)
+            print(f"📧 Analyzed email: {email['subject'][:50]}... (not added - confidence: {confidence}%)")
+            return 'low_confidence', None
         except Exception as e:
             print(f"❌ Error processing email: {e}")
-            return False
+            return 'error', None
     
-    def _add_or_update_application(self, company, position, stage):
+    def _link_thread(self, email, company, position):
+        if not self.current_user_id or not email.get('thread_id'):
+            return
         try:
-            existing = next((app for app in self.applications if 
-                           app["company"].lower() == company.lower() and 
-                           app["position"].lower() == position.lower()), None)
-            
-            is_new_application = False
-            
-            if existing:
-                stage_order = ['Applied', 'Interview', 'Offer', 'Rejected']
-                if stage_order.index(stage) > stage_order.index(existing.get('stage', 'Applied')) or stage == 'Rejected':
-                    existing['stage'] = stage
-                    existing['date_added'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            else:
-                app_id = self.app_counter_ref[0] if self.app_counter_ref else len(self.applications) + 1
-                if self.app_counter_ref:
-                    self.app_counter_ref[0] += 1
-                
-                self.applications.append({
-                    "id": app_id, "company": company, "position": position,
-                    "stage": stage, "date_added": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-                is_new_application = True
+            from utils.write_behind import get_writer
+            get_writer().link_thread(self.current_user_id, email['thread_id'], company, position)
+        except Exception as e:
+            print(f"❌ Failed to index thread: {e}")
 
-            # Persist to DB (if user available)
-            try:
-                from utils import db
-                if self.current_user_id:
-                    db.save_application(self.current_user_id, company, position, stage)
-                    print(f"✅ Saved application to DB: {company} - {position} ({stage})")
-            except Exception as e:
-                print(f"❌ Failed to save to DB: {e}")
-                pass
-            
-            return is_new_application
-        except:
+    def _add_or_update_application(self, company, position, stage):
+        try:
+            return self.store.upsert(company, position, stage, advance_only=True)[1]
+        except Exception as e:
+            print(f"❌ Failed to save application: {e}")
             return False
     
-    def manual_scan(self):
-        if not self.email_service.is_authenticated():
-            return False
+    @staticmethod
+    def _writer_stats():
         try:
-            self._check_emails()
-            return True
-        except:
+            from utils.write_behind import get_writer
+            return get_writer().stats()
+        except Exception:
+            return None
+
+    def notify_push(self, history_id=None):
+        """Gmail reported a mailbox change: poll now, unless the sync checkpoint is already past it"""
+        self.push_notifications += 1
+        if history_id and self.email_service.history_id and int(history_id) <= int(self.email_service.history_id):
+            return False
+        return self.is_running and self.scheduler.wake(self)
+
+    def manual_scan(self):
+        """Cut the current poll interval short; results flow through the pipeline as usual"""
+        if not self.email_service.is_authenticated() or not self.is_running:
             return False
+        return self.scheduler.wake(self)
     
     def get_status(self):
         return {
@@ -208,17 +413,80 @@ class EmailMonitor:
             'processed_emails': self.processed_emails,
             'check_interval': self.check_interval,
             'dynamic_interval': self.dynamic_interval,
-            'last_activity': self.last_activity_time
+            'push': {'ready': self.push_ready, 'notifications': self.push_notifications, 'watch_expiration': self.watch_expiration or None},
+            'last_activity': self.last_activity_time,
+            'history_id': self.email_service.history_id,
+            'fetch_errors': len(self.email_service.last_fetch_errors),
+            'skipped_candidates': self.email_service.skipped_candidates,
+            'analysis_cache': self.analyzer.cache.stats() if self.analyzer else None,
+            'pre_classifier': self.pre_classifier.stats(),
+            'template_matches': self.template_matches,
+            'thread_matches': self.thread_matches,
+            'analysis_pool': self.analysis_executor.stats(),
+            'write_behind': self._writer_stats(),
+            'broadcasts': self.broadcaster.stats(),
+            'scheduler': self.scheduler.stats(),
+            'pipeline': {
+                'fetch': {'fetched': self.fetched_emails, 'last_latency_ms': round(self.fetch_latency * 1000, 1)},
+                **(self.pipeline.stats() if self.pipeline else {})
+            }
         }
 
-_monitor_instance = None
+_shared_analysis = None
+_shared_analysis_lock = threading.Lock()
+_shared_pipeline = None
+
+def shared_analysis():
+    """One (AnalysisExecutor, analyzer) pair per process: every tenant's monitor shares the Gemini quota and cache"""
+    global _shared_analysis
+    with _shared_analysis_lock:
+        if _shared_analysis is None:
+            executor, analyzer = AnalysisExecutor(), None
+            if GeminiEmailAnalyzer and os.getenv('GEMINI_API_KEY'):
+                try:
+                    analyzer = GeminiEmailAnalyzer()
+                    analyzer.request_gate = executor.call
+                except:
+                    pass
+            _shared_analysis = (executor, analyzer)
+        return _shared_analysis
 
-def get_monitor():
-    return _monitor_instance
+def _per_monitor(handler, last=False):
+    """Shared-pipeline stage: each monitor handles its own items, so one account's failure stays its own"""
+    def handle(items):
+        groups = {}
+        for item in items:
+            groups.setdefault(item['monitor'], []).append(item)
+        outputs = []
+        for monitor, group in groups.items():
+            try:
+                outputs.extend(handler(monitor, group) or [])
+            except Exception as e:
+                print(f"❌ Pipeline stage {handler.__name__} failed: {e}")
+                for item in group:
+                    item.setdefault('error', str(e))
+                outputs.extend(group)
+            finally:
+                if last:
+                    monitor._finished(len(group))
+        return outputs
+    return handle
 
-def initialize_monitor(applications_list=None, app_counter_ref=None):
-    global _monitor_instance
-    _monitor_instance = EmailMonitor(applications_list)
-    if applications_list is not None and app_counter_ref is not None:
-        _monitor_instance.set_applications_ref(applications_list, app_counter_ref)
-    return _monitor_instance 
\ No newline at end of file
+def shared_pipeline():
+    """One ingestion pipeline per process, fed by every monitor, so thread count doesn't grow with accounts"""
+    global _shared_pipeline
+    executor, analyzer = shared_analysis()
+    with _shared_analysis_lock:
+        if _shared_pipeline is None:
+            queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', 100))
+            workers = executor.max_workers
+            # Smaller analyze batches let a burst spread over every worker instead of one big prompt
+            analyze_batch = int(os.getenv('PIPELINE_ANALYZE_BATCH', max(1, (analyzer.max_batch_size if analyzer else 1) // workers)))
+            _shared_pipeline = IngestionPipeline([
+                PipelineStage('extract', _per_monitor(EmailMonitor._extract_stage), workers=int(os.getenv('PIPELINE_EXTRACT_WORKERS', 2)), queue_size=queue_size, batch_size=10),
+                PipelineStage('analyze', _per_monitor(EmailMonitor._analyze_stage), workers=workers, queue_size=queue_size, batch_size=analyze_batch),
+                PipelineStage('persist', _per_monitor(EmailMonitor._persist_stage), queue_size=queue_size, ordered=True),
+                PipelineStage('notify', _per_monitor(EmailMonitor._notify_stage, last=True), queue_size=queue_size),
+            ])
+            _shared_pipeline.start()
+        return _shared_pipeline
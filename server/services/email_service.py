@@ -1,19 +1,59 @@
 import os
 import base64
 import re
+from collections import OrderedDict
 from datetime import datetime
 from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
+from googleapiclient.errors import HttpError
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+JOB_KEYWORDS = ['interview', 'application', 'position', 'role', 'candidate', 'hiring', 'recruitment', 'job', 'career', 'opportunity', 'hr', 'human resources', 'talent', 'recruiter']
+_KEYWORD_PATTERN = re.compile(r'\b(' + '|'.join(re.escape(k) for k in JOB_KEYWORDS) + r')\b', re.IGNORECASE)
+METADATA_HEADERS = ['Subject', 'From', 'Date']
+
+# Signals used to decide from headers alone whether a message is worth downloading in full
+_STRONG_SUBJECT_PATTERN = re.compile(
+    r'thank(s| you) for (applying|your application|your interest)|your application|application (received|status|update)|'
+    r'interview|next steps|offer|unfortunately|moving forward|assessment|coding challenge', re.IGNORECASE)
+_BULK_SUBJECT_PATTERN = re.compile(
+    r'newsletter|digest|job alert|jobs? (for you|you may|matching)|recommended (jobs|for you)|new jobs|'
+    r'weekly|webinar|\d+% off|\bsale\b|top (companies|jobs)|people (are|you may)', re.IGNORECASE)
+_BULK_SENDER_PATTERN = re.compile(
+    r'newsletter|digest|marketing|promo|news@|jobalerts|jobs-listings|alert@indeed|'
+    r'@(e\.)?(glassdoor|ziprecruiter|monster|dice|handshake|wellfound)\.com', re.IGNORECASE)
+
+
+def score_candidate(subject, sender, snippet=''):
+    """Cheap header/snippet relevance score; messages below the threshold are never downloaded in full"""
+    score = 2 * len(_KEYWORD_PATTERN.findall(subject)) + len(_KEYWORD_PATTERN.findall(snippet))
+    if _STRONG_SUBJECT_PATTERN.search(subject):
+        score += 3
+    if _BULK_SUBJECT_PATTERN.search(subject):
+        score -= 4
+    if _BULK_SENDER_PATTERN.search(sender):
+        score -= 4
+    return score
 
 class GmailService:
     def __init__(self, user_id=None, access_token=None, refresh_token=None, token_expiry=None):
         self.user_id = user_id
         self.service = None
-        self.processed_emails = set()
+        self.processed_emails = OrderedDict()  # Bounded in-memory cache in front of the processed_messages ledger
+        self.max_cached_ids = int(os.getenv('GMAIL_SEEN_CACHE_SIZE', 5000))
+        self.history_id = None  # Gmail history checkpoint for incremental sync
+        self.batch_size = max(1, min(100, int(os.getenv('GMAIL_BATCH_SIZE', 50))))  # Gmail caps batches at 100 calls
+        self.last_fetch_errors = {}
+        self.min_candidate_score = int(os.getenv('GMAIL_CANDIDATE_MIN_SCORE', 1))
+        self.skipped_candidates = 0
+        # Per-poll cap on new message ids; a larger burst is drained over several polls
+        self.max_messages_per_poll = max(1, int(os.getenv('GMAIL_MAX_MESSAGES_PER_POLL', 50)))
+        self._backlog = []              # Listed but not yet fetched message ids
+        self._next_page = None          # history.list page to continue listing from
+        self._listed_history_id = None  # Checkpoint to commit once the backlog is drained
+        self._backlog_errors = False
         
         self.client_id = os.getenv('GMAIL_CLIENT_ID')
         self.client_secret = os.getenv('GMAIL_CLIENT_SECRET')
@@ -105,6 +145,130 @@ class GmailService:
         except:
             return None
 
+    def get_messages(self, msg_ids, format='full', metadata_headers=None):
+        """Fetch messages through Gmail batch requests; returns [{'id', 'message', 'error', 'gone'}] in request order.
+        'gone' marks messages deleted since they were listed (404/410), which will never be fetchable"""
+        if not self.service:
+            return [{'id': msg_id, 'message': None, 'error': 'Gmail not connected', 'gone': False} for msg_id in msg_ids]
+
+        results = {msg_id: {'id': msg_id, 'message': None, 'error': None, 'gone': False} for msg_id in msg_ids}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                results[request_id]['error'] = str(exception)
+                results[request_id]['gone'] = isinstance(exception, HttpError) and exception.resp.status in (404, 410)
+            else:
+                results[request_id]['message'] = response
+
+        unique_ids = list(results)
+        for start in range(0, len(unique_ids), self.batch_size):
+            chunk = unique_ids[start:start + self.batch_size]
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for msg_id in chunk:
+                params = {'metadataHeaders': metadata_headers} if format == 'metadata' and metadata_headers else {}
+                batch.add(self.service.users().messages().get(userId='me', id=msg_id, format=format, **params), request_id=msg_id)
+            try:
+                batch.execute()
+            except Exception as e:
+                for msg_id in chunk:
+                    if results[msg_id]['message'] is None and results[msg_id]['error'] is None:
+                        results[msg_id]['error'] = str(e)
+        return [results[msg_id] for msg_id in unique_ids]
+
+    def mark_seen(self, msg_ids):
+        for msg_id in msg_ids:
+            self.processed_emails[msg_id] = True
+            self.processed_emails.move_to_end(msg_id)
+        while len(self.processed_emails) > self.max_cached_ids:
+            self.processed_emails.popitem(last=False)
+
+    def forget(self, msg_id):
+        """Let a message be fetched again, e.g. after its analysis failed"""
+        self.processed_emails.pop(msg_id, None)
+
+    def fetch_messages(self, msg_ids):
+        """Fetch specific unseen messages (e.g. retries); failures are simply retried later"""
+        if not self.service:
+            return []
+        return self._fetch_new_emails(msg_ids)[0]
+
+    def _unseen_ids(self, msg_ids):
+        """Drop ids already handled this session or recorded in the user's processed_messages ledger"""
+        unseen = [m for m in dict.fromkeys(msg_ids) if m not in self.processed_emails]
+        if self.user_id and unseen:
+            try:
+                from utils import db
+                done = db.get_processed_message_ids(self.user_id, unseen)
+                self.mark_seen(done)
+                unseen = [m for m in unseen if m not in done]
+            except Exception as e:
+                print(f"❌ Failed to read processed message ledger: {e}")
+        return unseen
+
+    def _record_skipped(self, msg_ids, outcome):
+        """Ledger messages that were filtered out before analysis so they are never fetched again"""
+        self.mark_seen(msg_ids)
+        if not self.user_id or not msg_ids:
+            return
+        try:
+            from utils import db
+            db.record_processed_messages(self.user_id, [(m, outcome, None) for m in msg_ids])
+        except Exception as e:
+            print(f"❌ Failed to record skipped messages: {e}")
+
+    def _linked_thread_ids(self, thread_ids):
+        if not self.user_id or not thread_ids:
+            return set()
+        try:
+            from utils import db
+            return set(db.get_thread_applications(self.user_id, thread_ids))
+        except Exception as e:
+            print(f"❌ Failed to look up thread index: {e}")
+            return set()
+
+    def _fetch_new_emails(self, msg_ids):
+        """Two-phase fetch of unseen messages: headers first, full payloads only for promising candidates.
+        Returns (email details, {msg_id: error} for failed fetches)."""
+        emails, errors, candidates, skipped, gone = [], {}, [], [], []
+        unseen = self._unseen_ids(msg_ids)
+
+        metadata = []
+        for result in self.get_messages(unseen, format='metadata', metadata_headers=METADATA_HEADERS):
+            if result['gone']:
+                gone.append(result['id'])
+            elif result['error'] or not result['message']:
+                errors[result['id']] = result['error'] or 'Empty response'
+            else:
+                metadata.append(result['message'])
+        # Replies on threads that already produced an application ("are you free Tuesday?") rarely
+        # contain job keywords, so they bypass the relevance gates and go to the thread index
+        linked = self._linked_thread_ids({m.get('threadId') for m in metadata if m.get('threadId')})
+
+        for message in metadata:
+            headers = {h['name']: h['value'] for h in message.get('payload', {}).get('headers', [])}
+            if message.get('threadId') in linked or score_candidate(headers.get('Subject', ''), headers.get('From', ''), message.get('snippet', '')) >= self.min_candidate_score:
+                candidates.append(message['id'])
+            else:
+                skipped.append(message['id'])
+        self.skipped_candidates += len(skipped)
+        self._record_skipped(skipped, 'skipped_metadata')
+
+        for result in self.get_messages(candidates):
+            if result['gone']:
+                gone.append(result['id'])
+                continue
+            if result['error'] or not result['message']:
+                errors[result['id']] = result['error'] or 'Empty response'
+                continue
+            emails.append({**self.extract_email_details(result['message']), 'linked_thread': result['message'].get('threadId') in linked})
+            self.mark_seen([result['id']])
+        # Deleted since history.list returned them: final, so they must not hold the checkpoint back
+        self._record_skipped(gone, 'gone')
+        if errors:
+            print(f"⚠️ Failed to fetch {len(errors)} Gmail message(s), will retry: {next(iter(errors.values()))}")
+        self.last_fetch_errors = errors
+        return emails, errors
+
     def extract_email_details(self, message):
         try:
             headers = {h['name']: h['value'] for h in message['payload'].get('headers', [])}
@@ -146,23 +310,110 @@ class GmailService:
         if not self.service:
             return []
         try:
-            keywords = ['interview', 'application', 'position', 'role', 'candidate', 'hiring', 'recruitment', 'job', 'career', 'opportunity', 'hr', 'human resources', 'talent', 'recruiter']
-            query = f"({' OR '.join([f'\"{k}\"' for k in keywords])}) AND newer_than:7d"
+            query = f"({' OR '.join([f'\"{k}\"' for k in JOB_KEYWORDS])}) AND newer_than:7d"
             
             messages = self.list_messages(query=query, max_results=max_results)
-            emails = []
-            
-            for message in messages:
-                if message['id'] not in self.processed_emails:
-                    full_message = self.get_message(message['id'])
-                    if full_message:
-                        emails.append(self.extract_email_details(full_message))
-                        self.processed_emails.add(message['id'])
-            
+            emails, _ = self._fetch_new_emails([m['id'] for m in messages])
             return emails
         except:
             return []
 
+    def get_current_history_id(self):
+        if not self.service:
+            return None
+        try:
+            return self.service.users().getProfile(userId='me').execute().get('historyId')
+        except:
+            return None
+
+    def watch(self, topic):
+        """Ask Gmail to publish INBOX changes to a Pub/Sub topic; returns the watch expiry (epoch seconds)"""
+        if not self.service:
+            return None
+        try:
+            response = self.service.users().watch(userId='me', body={'topicName': topic, 'labelIds': ['INBOX']}).execute()
+            return int(response['expiration']) / 1000
+        except Exception as e:
+            print(f"❌ Failed to register Gmail push notifications: {e}")
+            return None
+
+    def _list_added_message_ids(self, start_history_id, page_token=None, limit=None):
+        """Page through history.list from page_token until at least `limit` ids are listed.
+        Returns (message ids added since the checkpoint, latest historyId, token of the next page or None)"""
+        message_ids, seen = [], set()
+        latest_history_id = start_history_id
+        while True:
+            response = self.service.users().history().list(
+                userId='me', startHistoryId=start_history_id, historyTypes=['messageAdded'],
+                labelId='INBOX', pageToken=page_token
+            ).execute()
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    if (msg_id := added['message']['id']) not in seen:
+                        seen.add(msg_id)
+                        message_ids.append(msg_id)
+            latest_history_id = response.get('historyId', latest_history_id)
+            if not (page_token := response.get('nextPageToken')) or (limit and len(message_ids) >= limit):
+                return message_ids, latest_history_id, page_token
+
+    @property
+    def has_backlog(self):
+        """True while messages listed since the checkpoint are still waiting for a later poll"""
+        return bool(self._backlog or self._next_page)
+
+    def _reset_backlog(self):
+        self._backlog, self._next_page, self._listed_history_id, self._backlog_errors = [], None, None, False
+
+    def _full_resync(self, max_results):
+        """Bounded keyword search used to (re)establish the history checkpoint"""
+        self._reset_backlog()
+        # Read the checkpoint first so nothing arriving during the search is skipped
+        history_id = self.get_current_history_id()
+        emails = self.get_recent_emails(max_results=max_results)
+        if history_id:
+            self.history_id = history_id
+        return emails
+
+    def sync_new_emails(self, max_results=50):
+        """Fetch messages added since the last history checkpoint, at most max_messages_per_poll per
+        call, falling back to a full resync. The rest stay listed for the next call (see has_backlog)"""
+        if not self.service:
+            return []
+        if not self.history_id:
+            return self._full_resync(max_results)
+        limit = self.max_messages_per_poll
+        try:
+            if len(self._backlog) < limit and (self._next_page or not self._backlog):
+                listed, self._listed_history_id, self._next_page = self._list_added_message_ids(
+                    self.history_id, self._next_page, limit - len(self._backlog)
+                )
+                queued = set(self._backlog)
+                self._backlog += [msg_id for msg_id in listed if msg_id not in queued]
+        except HttpError as e:
+            self._reset_backlog()
+            if e.resp.status == 404:
+                print("⚠️ Gmail history checkpoint expired, running full resync")
+                self.history_id = None
+                return self._full_resync(max_results)
+            return []
+        except:
+            self._reset_backlog()
+            return []
+
+        message_ids, self._backlog = self._backlog[:limit], self._backlog[limit:]
+        fetched, errors = self._fetch_new_emails(message_ids)
+        emails = [e for e in fetched if e['linked_thread'] or _KEYWORD_PATTERN.search(f"{e['subject']} {e['sender']} {e['body']}")]
+        self._record_skipped([e['id'] for e in fetched if e not in emails], 'filtered')
+
+        # The checkpoint only moves once the whole backlog is handled, and stays put if anything
+        # failed so the next listing from it retries those messages (handled ones are in the ledger)
+        self._backlog_errors |= bool(errors)
+        if not self.has_backlog:
+            if not self._backlog_errors:
+                self.history_id = self._listed_history_id
+            self._reset_backlog()
+        return emails
+
     def get_credentials_dict(self):
         if not self.credentials:
             return None
@@ -172,4 +423,4 @@ class GmailService:
             'token_expiry': self.credentials.expiry.isoformat() if self.credentials.expiry else None,
             'client_id': self.credentials.client_id,
             'client_secret': self.credentials.client_secret
-        } 
\ No newline at end of file
+        }
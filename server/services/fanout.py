@@ -0,0 +1,141 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+
+class _Client:
+    def __init__(self, sid, room, buffer_size):
+        self.sid = sid
+        self.room = room
+        self.buffer = deque()
+        self.buffer_size = buffer_size
+        self.inflight = 0
+        self.last_ack = time.time()
+        self.sent = 0
+        self.resyncs = 0
+
+
+class FanoutWorker:
+    """Delivers Socket.IO events off the request and monitor threads. publish() only enqueues; a
+    single worker copies each event into the per-client buffers of the room's members and sends
+    while a client has fewer than max_inflight unacknowledged events. A client whose buffer
+    overflows gets its backlog replaced by one 'resync_required' event; one that stops
+    acknowledging for stall_timeout seconds is disconnected."""
+
+    def __init__(self, socketio, buffer_size=None, max_inflight=None, stall_timeout=None):
+        self.socketio = socketio
+        self.buffer_size = buffer_size or int(os.getenv('FANOUT_CLIENT_BUFFER', 100))
+        self.max_inflight = max_inflight or int(os.getenv('FANOUT_MAX_INFLIGHT', 10))
+        self.stall_timeout = stall_timeout or float(os.getenv('FANOUT_STALL_SECONDS', 30))
+        self._queue = queue.Queue()
+        self._clients = {}
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.published = 0
+        self.dropped_clients = 0
+
+    def start(self):
+        if not self._thread:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='socket-fanout')
+            self._thread.start()
+        return self
+
+    def add_client(self, sid, room):
+        with self._lock:
+            self._clients[sid] = _Client(sid, room, self.buffer_size)
+            self._rooms.setdefault(room, set()).add(sid)
+
+    def remove_client(self, sid):
+        with self._lock:
+            if client := self._clients.pop(sid, None):
+                members = self._rooms.get(client.room, set())
+                members.discard(sid)
+                if not members:
+                    self._rooms.pop(client.room, None)
+
+    def publish(self, room, event, payload):
+        """Queue an event for every client in `room`; never blocks on the clients themselves"""
+        self.start()._queue.put(('room', room, event, payload))
+
+    def send(self, sid, event, payload, reset=False):
+        """Queue an event for one client; reset drops its backlog first (e.g. for a fresh snapshot)"""
+        self.start()._queue.put(('client', sid, event, payload, reset))
+
+    def _run(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=1)
+            except queue.Empty:
+                job = None
+            try:
+                if job:
+                    self._dispatch(job)
+                self._check_stalled()
+            except Exception as e:
+                print(f"❌ Socket fan-out failed: {e}")
+
+    def _dispatch(self, job):
+        with self._lock:
+            if job[0] == 'ack':
+                if client := self._clients.get(job[1]):
+                    client.inflight = max(0, client.inflight - 1)
+                    client.last_ack = time.time()
+                    self._pump(client)
+                return
+            if job[0] == 'room':
+                _, room, event, payload = job
+                self.published += 1
+                targets = [self._clients[sid] for sid in self._rooms.get(room, ())]
+            else:
+                _, sid, event, payload, reset = job
+                targets = [client] if (client := self._clients.get(sid)) else []
+                if reset:
+                    for client in targets:
+                        client.buffer.clear()
+            for client in targets:
+                if len(client.buffer) >= client.buffer_size:
+                    # Too far behind for deltas to be worth sending: collapse the backlog into a resync
+                    print(f"⚠️ Socket client {client.sid} fell behind, asking it to resync")
+                    client.buffer.clear()
+                    client.buffer.append(('resync_required', {'reason': 'buffer_overflow'}))
+                    client.resyncs += 1
+                else:
+                    client.buffer.append((event, payload))
+                self._pump(client)
+
+    def _pump(self, client):
+        while client.buffer and client.inflight < self.max_inflight:
+            event, payload = client.buffer.popleft()
+            if client.inflight == 0:
+                client.last_ack = time.time()
+            client.inflight += 1
+            client.sent += 1
+            self.socketio.emit(event, payload, to=client.sid, callback=lambda *_, sid=client.sid: self._queue.put(('ack', sid)))
+
+    def _check_stalled(self):
+        now = time.time()
+        with self._lock:
+            stalled = [sid for sid, client in self._clients.items() if client.inflight and now - client.last_ack > self.stall_timeout]
+        for sid in stalled:
+            print(f"⚠️ Dropping socket client {sid}: no acknowledgement for {self.stall_timeout:.0f}s")
+            self.remove_client(sid)
+            self.dropped_clients += 1
+            try:
+                self.socketio.server.disconnect(sid)
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'rooms': len(self._rooms),
+                'published': self.published,
+                'pending': self._queue.qsize(),
+                'buffered': sum(len(c.buffer) for c in self._clients.values()),
+                'resyncs': sum(c.resyncs for c in self._clients.values()),
+                'dropped_clients': self.dropped_clients
+            }
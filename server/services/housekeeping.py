@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+from utils.pre_classifier import PreClassifier
+
+
+class Housekeeping:
+    """Process-wide upkeep shared by every monitor: one PreClassifier trained on all users' labels,
+    retrained every RETRAIN_EVERY new labels, plus an hourly ledger prune and retrain. Monitors call
+    run_if_due() on every poll; only the first caller after the hour does the work."""
+
+    RETRAIN_EVERY = 50
+
+    def __init__(self, interval=3600, retention_days=None):
+        self.interval = interval
+        self.retention_days = retention_days or int(os.getenv('PROCESSED_LEDGER_RETENTION_DAYS', 30))
+        self.pre_classifier = PreClassifier()
+        self.labels_since_training = 0
+        self.last_run = 0
+        self._lock = threading.Lock()
+        self._training = threading.Lock()
+
+    def run_if_due(self):
+        with self._lock:
+            if time.time() - self.last_run < self.interval:
+                return False
+            self.last_run = time.time()
+        try:
+            from utils import db
+            if removed := db.prune_processed_messages(self.retention_days):
+                print(f"🧹 Pruned {removed} processed message records")
+        except Exception as e:
+            print(f"❌ Failed to prune processed message ledger: {e}")
+        self.train()
+        return True
+
+    def label_added(self):
+        """Count a new training label; retrains once enough have accumulated"""
+        with self._lock:
+            self.labels_since_training += 1
+            due = self.labels_since_training >= self.RETRAIN_EVERY
+        if due:
+            self.train()
+
+    def train(self):
+        # One retrain at a time; callers arriving mid-training just rely on its result
+        if not self._training.acquire(blocking=False):
+            return
+        try:
+            from utils import db
+            with self._lock:
+                self.labels_since_training = 0
+            if self.pre_classifier.train(db.get_email_labels()):
+                print(f"🧠 Pre-classifier trained on {self.pre_classifier.training_examples} labeled emails")
+        except Exception as e:
+            print(f"❌ Failed to train pre-classifier: {e}")
+        finally:
+            self._training.release()
+
+
+_housekeeping = None
+_housekeeping_lock = threading.Lock()
+
+
+def get_housekeeping():
+    global _housekeeping
+    with _housekeeping_lock:
+        if _housekeeping is None:
+            _housekeeping = Housekeeping()
+        return _housekeeping
@@ -0,0 +1,138 @@
+import heapq
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class PipelineStage:
+    """One stage of an IngestionPipeline: a bounded input queue drained by `workers` threads.
+    The handler takes a list of items (up to batch_size, whatever is already queued) and returns
+    the items to pass downstream. Stages feeding an ordered stage must emit every item they receive."""
+
+    def __init__(self, name, handler, workers=1, queue_size=100, batch_size=1, ordered=False):
+        if ordered and workers != 1:
+            raise ValueError("An ordered stage must have exactly one worker")
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.errors = 0
+        self.avg_latency = 0.0  # Exponential moving average of handler time per item, in seconds
+        self.last_latency = 0.0
+
+    def record(self, elapsed, count):
+        self.processed += count
+        self.last_latency = elapsed / max(count, 1)
+        self.avg_latency = self.last_latency if self.processed == count else 0.8 * self.avg_latency + 0.2 * self.last_latency
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'workers': self.workers,
+            'processed': self.processed,
+            'errors': self.errors,
+            'avg_latency_ms': round(self.avg_latency * 1000, 1),
+            'last_latency_ms': round(self.last_latency * 1000, 1)
+        }
+
+
+class IngestionPipeline:
+    """Chain of PipelineStages connected by bounded queues. put() blocks when the first stage is
+    full, so backpressure reaches the producer; stop() drains in-flight items before returning."""
+
+    def __init__(self, stages):
+        self.stages = stages
+        self._threads = []
+        self._exited = [0] * len(stages)
+        self._lock = threading.Lock()
+        self._seq_lock = threading.Lock()
+        self._next_seq = 0
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                thread = threading.Thread(target=self._run_worker, args=(index,), daemon=True, name=f'{stage.name}-{worker}')
+                thread.start()
+                self._threads.append(thread)
+
+    def put(self, item, timeout=None):
+        """Enqueue an item (a dict) for the first stage; raises queue.Full if it stays full past timeout"""
+        with self._seq_lock:
+            item['seq'] = self._next_seq
+            self.stages[0].queue.put(item, timeout=timeout)
+            self._next_seq += 1
+
+    def stop(self, timeout=10):
+        deadline = time.time() + timeout
+        for _ in range(self.stages[0].workers):
+            try:
+                self.stages[0].queue.put(_STOP, timeout=max(0.1, deadline - time.time()))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout=max(0, deadline - time.time()))
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def _run_worker(self, index):
+        stage = self.stages[index]
+        reorder, next_seq = [], 0
+        stopping = False
+        while not stopping:
+            items = []
+            item = stage.queue.get()
+            if item is _STOP:
+                stopping = True
+            else:
+                items.append(item)
+                while len(items) < stage.batch_size:
+                    try:
+                        item = stage.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    items.append(item)
+
+            if stage.ordered:
+                for item in items:
+                    heapq.heappush(reorder, (item['seq'], id(item), item))
+                items = []
+                while reorder and (stopping or reorder[0][0] == next_seq):
+                    items.append(heapq.heappop(reorder)[2])
+                    next_seq = items[-1]['seq'] + 1
+
+            if items:
+                self._handle(index, items)
+
+        with self._lock:
+            self._exited[index] += 1
+            last_worker = self._exited[index] == stage.workers
+        if last_worker and index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].workers):
+                self.stages[index + 1].queue.put(_STOP)
+
+    def _handle(self, index, items):
+        stage = self.stages[index]
+        started = time.perf_counter()
+        try:
+            outputs = stage.handler(items)
+        except Exception as e:
+            print(f"❌ Pipeline stage '{stage.name}' failed: {e}")
+            stage.errors += 1
+            for item in items:
+                item.setdefault('error', str(e))
+            outputs = items
+        stage.record(time.perf_counter() - started, len(items))
+        if index + 1 < len(self.stages):
+            for output in outputs or []:
+                self.stages[index + 1].queue.put(output)
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
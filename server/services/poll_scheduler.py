@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+
+class PollScheduler:
+    """Runs every monitor's Gmail polls on a fixed pool of worker threads. Monitors wait in a heap
+    ordered by due time; a worker takes the earliest due one, calls its poll_once() and queues it
+    again after the interval that poll returned, jittered by ±jitter so accounts that came due
+    together drift apart. A monitor is queued at most once and polled by one worker at a time. Each
+    poll handles at most GMAIL_MAX_MESSAGES_PER_POLL new messages and a larger burst is carried over
+    to the account's next turn, so a busy account waits behind others already due instead of
+    holding a worker until its whole mailbox delta is fetched."""
+
+    def __init__(self, workers=None, jitter=None):
+        self.workers = workers or int(os.getenv('POLL_WORKERS', 4))
+        self.jitter = jitter if jitter is not None else float(os.getenv('POLL_JITTER', 0.1))
+        self._cond = threading.Condition()
+        self._heap = []
+        self._due = {}       # monitor -> sequence number of its live heap entry
+        self._active = set()
+        self._running = set()
+        self._woken = set()  # Woken mid-poll: poll again as soon as the current one finishes
+        self._seq = itertools.count()
+        self._threads = []
+        self.polls = 0
+        self.failed_polls = 0
+        self.total_lag = 0
+        self.max_lag = 0
+
+    def start(self):
+        with self._cond:
+            if not self._threads:
+                for worker in range(self.workers):
+                    thread = threading.Thread(target=self._run, daemon=True, name=f'poll-{worker}')
+                    thread.start()
+                    self._threads.append(thread)
+        return self
+
+    def add(self, monitor, delay=0):
+        """Start polling a monitor, first after `delay` seconds"""
+        self.start()
+        with self._cond:
+            self._active.add(monitor)
+            if monitor not in self._running:
+                self._push(monitor, delay)
+
+    def wake(self, monitor):
+        """Poll now instead of at the next due time"""
+        with self._cond:
+            if monitor not in self._active:
+                return False
+            if monitor in self._running:
+                self._woken.add(monitor)
+            else:
+                self._push(monitor, 0)
+            return True
+
+    def remove(self, monitor, timeout=None):
+        """Stop polling a monitor, waiting for a poll already in progress to return"""
+        with self._cond:
+            self._active.discard(monitor)
+            self._due.pop(monitor, None)
+            self._woken.discard(monitor)
+            return self._cond.wait_for(lambda: monitor not in self._running, timeout)
+
+    def _push(self, monitor, delay):
+        """Queue (or re-time) a monitor's next poll; any older heap entry goes stale. Callers hold the lock"""
+        seq = next(self._seq)
+        self._due[monitor] = seq
+        heapq.heappush(self._heap, (time.monotonic() + delay, seq, monitor))
+        self._cond.notify()
+
+    def _next_due(self):
+        """Block until some monitor is due and claim it"""
+        with self._cond:
+            while True:
+                while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][1]:
+                    heapq.heappop(self._heap)  # Re-timed or removed since it was queued
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                if (wait := self._heap[0][0] - time.monotonic()) > 0:
+                    self._cond.wait(wait)
+                    continue
+                due, _, monitor = heapq.heappop(self._heap)
+                del self._due[monitor]
+                self._running.add(monitor)
+                lag = time.monotonic() - due
+                self.total_lag += lag
+                self.max_lag = max(self.max_lag, lag)
+                return monitor
+
+    def _run(self):
+        while True:
+            monitor = self._next_due()
+            interval = None
+            try:
+                interval = monitor.poll_once()
+            except Exception as e:
+                print(f"❌ Scheduled poll failed: {e}")
+                self.failed_polls += 1
+            with self._cond:
+                self.polls += 1
+                self._running.discard(monitor)
+                if monitor in self._active and monitor not in self._due:
+                    if monitor in self._woken or interval is None:
+                        self._push(monitor, 0 if monitor in self._woken else 5)
+                    else:
+                        self._push(monitor, interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+                self._woken.discard(monitor)
+                self._cond.notify_all()  # remove() may be waiting for this poll to return
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'accounts': len(self._active),
+                'polling': len(self._running),
+                'polls': self.polls,
+                'failed_polls': self.failed_polls,
+                'avg_lag_ms': round(self.total_lag / self.polls * 1000, 1) if self.polls else 0,
+                'max_lag_ms': round(self.max_lag * 1000, 1)
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler shared by every tenant's monitor"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PollScheduler()
+        return _scheduler
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from .application_store import ApplicationStore
+from .email_monitor import EmailMonitor
+from .email_service import GmailService
+from utils import db
+
+
+class Tenant:
+    """Everything the backend keeps in memory for one signed-in user"""
+
+    def __init__(self, user_id, email, monitor):
+        self.user_id = user_id
+        self.email = email
+        self.monitor = monitor
+        self.store = monitor.store
+        self.broadcast_lock = threading.Lock()
+        self.broadcast_version = self.store.version  # Last board version pushed to this user's sockets
+        self.last_seen = time.time()
+
+    def close(self):
+        """Stop the monitor (draining its pipeline) and keep any refreshed Gmail tokens"""
+        try:
+            self.monitor.stop_monitoring(wait=True)
+            db.save_gmail_credentials(self.user_id, self.monitor.email_service.get_credentials_dict())
+        except Exception as e:
+            print(f"❌ Failed to close tenant {self.email}: {e}")
+
+
+class TenantRegistry:
+    """LRU cache of Tenants keyed by user id. A miss rehydrates the tenant from SQLite (board,
+    Gmail credentials, sync checkpoint) and resumes monitoring; past TENANT_CACHE_SIZE the least
+    recently used tenant is closed in the background and forgotten until its next request."""
+
+    def __init__(self, on_created=None, capacity=None):
+        self.on_created = on_created  # Called with each new Tenant, e.g. to wire its broadcast callbacks
+        self.capacity = capacity or int(os.getenv('TENANT_CACHE_SIZE', 100))
+        self._tenants = OrderedDict()
+        self._user_locks = {}
+        self._lock = threading.Lock()
+        self.rehydrations = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        """The user's tenant, rehydrated from the DB if needed; None for unknown users"""
+        if not user_id:
+            return None
+        with self._lock:
+            if tenant := self._touch(user_id):
+                return tenant
+            user_lock = self._user_locks.setdefault(user_id, threading.Lock())
+        # Rehydration may refresh Gmail tokens over the network, so only this user waits on it
+        with user_lock:
+            with self._lock:
+                if tenant := self._touch(user_id):
+                    return tenant
+            if not (email := db.get_user_email(user_id)):
+                return None
+            credentials = db.get_gmail_credentials(user_id)
+            tenant = self._build(user_id, email, GmailService(user_id, **credentials) if credentials else GmailService(user_id))
+            self.rehydrations += 1
+            print(f"♻️ Rehydrated tenant {email} ({len(tenant.store)} applications)")
+            tenant.monitor.start_monitoring()
+            return self._admit(tenant)
+
+    def login(self, email, email_service):
+        """Register a freshly authenticated Gmail account, replacing any tenant it already had"""
+        user_id = db.ensure_user(email)
+        db.save_gmail_credentials(user_id, email_service.get_credentials_dict())
+        with self._lock:
+            previous = self._tenants.pop(user_id, None)
+        if previous:
+            threading.Thread(target=previous.close, daemon=True).start()
+        email_service.user_id = user_id
+        return self._admit(self._build(user_id, email, email_service))
+
+    def _build(self, user_id, email, email_service):
+        monitor = EmailMonitor(ApplicationStore(), email_service=email_service)
+        monitor.set_current_user(user_id)  # Binds the store to the user's rows and loads the sync checkpoint
+        tenant = Tenant(user_id, email, monitor)
+        if self.on_created:
+            self.on_created(tenant)
+        return tenant
+
+    def _touch(self, user_id):
+        if tenant := self._tenants.get(user_id):
+            self._tenants.move_to_end(user_id)
+            tenant.last_seen = time.time()
+        return tenant
+
+    def _admit(self, tenant):
+        with self._lock:
+            self._tenants[tenant.user_id] = tenant
+            self._tenants.move_to_end(tenant.user_id)
+            evicted = []
+            while len(self._tenants) > self.capacity:
+                evicted.append(self._tenants.popitem(last=False)[1])
+            self.evictions += len(evicted)
+        for idle in evicted:
+            print(f"💤 Evicting idle tenant {idle.email}")
+            threading.Thread(target=idle.close, daemon=True).start()
+        return tenant
+
+    def tenants(self):
+        with self._lock:
+            return list(self._tenants.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': len(self._tenants),
+                'capacity': self.capacity,
+                'rehydrations': self.rehydrations,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from utils import db
+from utils.write_behind import get_writer
+
+
+def _normalize(text):
+    return re.sub(r'\s+', ' ', (text or '').strip().lower())
+
+
+def _sender_address(sender):
+    match = re.search(r'<([^>]+)>', sender or '')
+    return _normalize(match.group(1) if match else sender)
+
+
+class AnalysisCache:
+    """Two-tier cache of analyzer results: an in-process LRU backed by the analysis_cache table"""
+
+    def __init__(self, version, max_memory_entries=None, ttl_seconds=None, max_persistent_entries=None):
+        self.version = version
+        self.max_memory_entries = max_memory_entries or int(os.getenv('ANALYSIS_CACHE_SIZE', 1000))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('ANALYSIS_CACHE_TTL_DAYS', 30)) * 86400
+        self.max_persistent_entries = max_persistent_entries or int(os.getenv('ANALYSIS_CACHE_MAX_ROWS', 20000))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_eviction = 0
+        self._touched = {}  # key -> last hit time, written back to last_used_at in batches
+        self.touch_batch = int(os.getenv('ANALYSIS_CACHE_TOUCH_BATCH', 50))
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def make_key(self, subject, body, sender):
+        payload = '\x1f'.join([self.version, _normalize(subject), _normalize(body), _sender_address(sender)])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                created_at, result = self._memory[key]
+                if time.time() - created_at < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    self._touch(key)
+                    return dict(result)
+                del self._memory[key]
+
+        try:
+            row = db.get_cached_analysis(key, time.time() - self.ttl_seconds)
+        except Exception as e:
+            print(f"❌ Analysis cache read failed: {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.persistent_hits += 1
+            self._remember(key, row[0], row[1])
+            self._touch(key)
+        return dict(row[1])
+
+    def put(self, key, result):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, result)
+            self._puts_since_eviction += 1
+            evict = self._puts_since_eviction >= 100
+            if evict:
+                self._puts_since_eviction = 0
+        try:
+            db.put_cached_analysis(key, json.dumps(result), now)
+            if evict:
+                # Recency has to be on disk before the LRU eviction reads it
+                with self._lock:
+                    future = self._write_touches()
+                if future:
+                    future.result(timeout=5)
+                db.evict_analysis_cache(now - self.ttl_seconds, self.max_persistent_entries)
+        except Exception as e:
+            print(f"❌ Analysis cache write failed: {e}")
+
+    def _touch(self, key):
+        """Record a hit in memory; callers hold the lock. Hits reach the DB in batches through the
+        write-behind queue, so cache reads never contend for SQLite's write lock"""
+        self._touched[key] = time.time()
+        if len(self._touched) >= self.touch_batch:
+            self._write_touches()
+
+    def _write_touches(self):
+        """Queue the pending last-used times; callers hold the lock. Returns the write's future, if any"""
+        touched, self._touched = list(self._touched.items()), {}
+        return get_writer().touch_analysis_cache(touched)
+
+    def _remember(self, key, created_at, result):
+        self._memory[key] = (created_at, dict(result))
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.persistent_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'persistent_hits': self.persistent_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.persistent_hits) / lookups * 100, 1) if lookups else 0,
+                'memory_entries': len(self._memory)
+            }
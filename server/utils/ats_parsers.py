@@ -0,0 +1,138 @@
+import re
+
+# Registry of deterministic extractors for applicant tracking system templates, consulted before the model
+_PARSERS = []
+
+# Names start with a capital or digit even inside the IGNORECASE patterns below
+_NAME = r"(?-i:[A-Z0-9])[\w&'.,()/+ -]{0,80}?"
+_COMPANY_PATTERNS = [
+    re.compile(rf"(?:thank you|thanks) for (?:applying|your application|your interest|submitting your application)(?: to| in| at| with) (?P<company>{_NAME})(?:[!.,;]|\s+(?:and|for|we|team)\b|\s*$)", re.IGNORECASE | re.MULTILINE),
+    re.compile(rf"(?:position|role|opening|job) (?:at|with) (?P<company>{_NAME})(?:[!.,;]|\s+(?:and|has|is|we)\b|\s*$)", re.IGNORECASE | re.MULTILINE),
+    re.compile(rf"interest in (?:joining |working at )?(?P<company>{_NAME})(?:[!.,;]|\s+(?:and|for|we)\b|\s*$)", re.IGNORECASE | re.MULTILINE),
+]
+_POSITION_PATTERNS = [
+    re.compile(rf"(?:application|applying|applied) (?:for|to) (?:the |our |a )?(?P<position>{_NAME}) (?:position|role|opening|job)\b", re.IGNORECASE),
+    re.compile(rf"(?:application|applying|applied) (?:for|to) (?:the |our |a )?(?P<position>{_NAME})(?: \(.*?\))? (?:at|with) ", re.IGNORECASE),
+    re.compile(rf"received your application for (?:the |our )?(?P<position>{_NAME})(?:[,.;]| position| role| and)", re.IGNORECASE),
+    re.compile(rf"(?:for|about) the (?P<position>{_NAME}) (?:position|role|opening)\b", re.IGNORECASE),
+]
+_STAGE_PATTERNS = [
+    ('rejected', re.compile(r"unfortunately|not (?:to )?(?:be )?mov(?:e|ing) forward|decided to (?:pursue|proceed with) other|no longer (?:being )?considered|will not be proceeding|position has been filled", re.IGNORECASE)),
+    ('offer', re.compile(r"pleased to (?:extend|offer)|offer letter|extend (?:you )?an offer", re.IGNORECASE)),
+    ('final_interview', re.compile(r"final (?:round|interview)|onsite interview|on-site interview", re.IGNORECASE)),
+    ('technical_interview', re.compile(r"technical (?:interview|screen)|coding (?:interview|challenge|assessment)|take-home", re.IGNORECASE)),
+    ('phone_screen', re.compile(r"phone screen|(?:schedule|book) (?:a |an |your )?(?:call|interview|time)|recruiter call|interview invitation|invite you to (?:an )?interview", re.IGNORECASE)),
+    ('application_received', re.compile(r"thank(?:s| you) for (?:applying|your application|submitting)|received your application|application (?:has been |was )?received|we will review", re.IGNORECASE)),
+]
+# Phrase captures like "the Product Designer position" or "our team" are not company names
+_NOT_A_COMPANY = re.compile(r"^(?:the|a|an|our|this|your|that)\b|\b(?:position|role|opening|job|team)$", re.IGNORECASE)
+_SENDER_NAME_SUFFIX = re.compile(r"\s*(?:[-|@]\s*)?(?:hiring team|recruiting(?: team)?|recruitment|careers|talent(?: acquisition)?(?: team)?|jobs|hr|people team|team)\s*$", re.IGNORECASE)
+
+
+def register_parser(name, sender_pattern):
+    """Register a template extractor for mail whose From header matches sender_pattern"""
+    pattern = re.compile(sender_pattern, re.IGNORECASE)
+
+    def decorator(func):
+        _PARSERS.append((name, pattern, func))
+        return func
+    return decorator
+
+
+def _clean(value):
+    value = re.sub(r'\s+', ' ', value or '').strip(" \t-,.;:!'\"")
+    return value or None
+
+
+def _first_match(patterns, text, group, reject=None):
+    for pattern in patterns:
+        for match in pattern.finditer(text):
+            if (value := _clean(match.group(group))) and not (reject and reject.search(value)):
+                return value
+    return None
+
+
+def _normalize_name(name):
+    return re.sub(r'\W+', ' ', (name or '').lower()).strip()
+
+
+def _sender_display_name(sender):
+    if match := re.match(r'\s*"?([^"<]+?)"?\s*<', sender or ''):
+        name = _SENDER_NAME_SUFFIX.sub('', match.group(1)).strip(" -|@")
+        if name and not re.search(r'no-?reply|notifications?|greenhouse|lever|workday|ashby|smartrecruiters', name, re.IGNORECASE):
+            return name
+    return None
+
+
+def detect_stage(text):
+    """Stage implied by well-known status phrases, or None when the wording is not recognised"""
+    return next((stage for stage, pattern in _STAGE_PATTERNS if pattern.search(text)), None)
+
+
+def extract_template_fields(email):
+    """Shared phrase-level extraction; the registered parsers layer vendor quirks on top of it"""
+    text = f"{email.get('subject', '')}\n{email.get('body', '')}"
+    phrase_company = _first_match(_COMPANY_PATTERNS, text, 'company', reject=_NOT_A_COMPANY)
+    sender_company = _sender_display_name(email.get('sender', ''))
+    return {
+        'company_name': phrase_company or sender_company,
+        'job_title': _first_match(_POSITION_PATTERNS, text, 'position'),
+        'interview_stage': detect_stage(text),
+        # A company read only from a generic phrase is a guess unless the sender's display name agrees
+        '_company_guessed': bool(phrase_company) and _normalize_name(phrase_company) != _normalize_name(sender_company),
+    }
+
+
+@register_parser('greenhouse', r'@([\w-]+\.)*greenhouse(-mail)?\.io')
+def parse_greenhouse(email):
+    return extract_template_fields(email)
+
+
+@register_parser('lever', r'@([\w-]+\.)*lever\.co\b')
+def parse_lever(email):
+    fields = extract_template_fields(email)
+    # Lever confirmations read "... applying to the <position> role at <company>"
+    if match := re.search(rf"to the (?P<position>{_NAME}) (?:role|position) at (?P<company>{_NAME})(?:[!.,]|\s*$)", email.get('body', ''), re.IGNORECASE | re.MULTILINE):
+        fields.update(job_title=_clean(match.group('position')), company_name=_clean(match.group('company')), _company_guessed=False)
+    return fields
+
+
+@register_parser('workday', r'@([\w-]+\.)*myworkday(jobs)?\.com')
+def parse_workday(email):
+    fields = extract_template_fields(email)
+    # Workday appends requisition ids, e.g. "Software Engineer (R12345)" or "R12345 Software Engineer"
+    if fields['job_title']:
+        fields['job_title'] = _clean(re.sub(r'\(?\b(?:JR|R|REQ)[-_]?\d{3,}\b\)?', '', fields['job_title']))
+    return fields
+
+
+@register_parser('ashby', r'@([\w-]+\.)*ashbyhq\.com')
+def parse_ashby(email):
+    return extract_template_fields(email)
+
+
+@register_parser('smartrecruiters', r'@([\w-]+\.)*smartrecruiters\.com')
+def parse_smartrecruiters(email):
+    fields = extract_template_fields(email)
+    if not fields['company_name'] and (match := re.search(rf"application at (?P<company>{_NAME})(?:[!.,]|\s*$)", email.get('subject', ''), re.IGNORECASE)):
+        fields.update(company_name=_clean(match.group('company')), _company_guessed=False)
+    return fields
+
+
+def parse_known_template(email):
+    """Return an analyzer-shaped result for mail from a registered ATS, or None if no parser matches.
+    Confidence reflects how much of the template was recognised; callers decide whether it is enough."""
+    sender = email.get('sender', '')
+    for name, pattern, parser in _PARSERS:
+        if not pattern.search(sender):
+            continue
+        try:
+            fields = parser(email)
+        except Exception as e:
+            print(f"❌ {name} template parser failed: {e}")
+            return None
+        guessed = fields.pop('_company_guessed', False)
+        found = sum(1 for key in ('company_name', 'job_title', 'interview_stage') if fields.get(key))
+        # Never confident enough to skip the model on a guessed company
+        return {**fields, 'confidence': {3: 60 if guessed else 95, 2: 60, 1: 30}.get(found, 0), 'source': f'ats:{name}'}
+    return None
@@ -1,59 +1,512 @@
-import sqlite3, os
-from datetime import datetime
+import sqlite3, os, re, json, base64, hashlib, secrets, threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from cryptography.fernet import Fernet, InvalidToken
 
-# Single connection shared across the backend
 _DB_PATH = os.getenv('WHERESMYJOBAT_DB_PATH', os.path.join(os.path.dirname(__file__), '..', '..', 'wheresmyjobat.db'))
-conn = sqlite3.connect(_DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
-
-cursor.execute('CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT UNIQUE, created_at TEXT)')
-cursor.execute('''CREATE TABLE IF NOT EXISTS applications (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    company TEXT,
-    position TEXT,
-    stage TEXT,
-    date_added TEXT,
-    UNIQUE(user_id, company, position)
-)''')
-conn.commit()
+_BUSY_TIMEOUT_MS = int(os.getenv('WHERESMYJOBAT_DB_BUSY_TIMEOUT_MS', 5000))
+_SESSION_TTL = timedelta(days=int(os.getenv('SESSION_TTL_DAYS', 14)))
+_RETRY_BASE_SECONDS = float(os.getenv('ANALYSIS_RETRY_SECONDS', 300))
+_MAX_ANALYSIS_ATTEMPTS = int(os.getenv('ANALYSIS_MAX_ATTEMPTS', 5))
+_LOGIN_CODE_TTL = timedelta(seconds=int(os.getenv('LOGIN_CODE_TTL_SECONDS', 60)))
+
+# One connection per thread: Flask request threads, the monitor and pipeline workers never share a cursor
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """Lazily open this thread's connection in WAL mode so readers never wait on the writer"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        # isolation_level=None: statements autocommit unless wrapped in transaction()
+        conn = sqlite3.connect(_DB_PATH, timeout=_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={_BUSY_TIMEOUT_MS}')
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def transaction():
+    """Explicit write transaction on this thread's connection; nested scopes join the outer one"""
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    # IMMEDIATE takes the write lock up front so busy_timeout applies instead of failing mid-transaction
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+with transaction() as _conn:
+    _conn.execute('CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT UNIQUE, created_at TEXT)')
+    _conn.execute('''CREATE TABLE IF NOT EXISTS applications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        company TEXT,
+        position TEXT,
+        stage TEXT,
+        date_added TEXT,
+        UNIQUE(user_id, company, position)
+    )''')
+    _conn.execute('CREATE TABLE IF NOT EXISTS gmail_sync_state (user_id INTEGER PRIMARY KEY, history_id TEXT, updated_at TEXT)')
+    _conn.execute('''CREATE TABLE IF NOT EXISTS processed_messages (
+        user_id INTEGER,
+        message_id TEXT,
+        outcome TEXT,
+        analyzer_version TEXT,
+        processed_at TEXT,
+        PRIMARY KEY (user_id, message_id)
+    )''')
+    _conn.execute('CREATE INDEX IF NOT EXISTS idx_processed_messages_processed_at ON processed_messages (processed_at)')
+    _conn.execute('CREATE TABLE IF NOT EXISTS analysis_cache (cache_key TEXT PRIMARY KEY, result TEXT, created_at REAL, last_used_at REAL)')
+    _conn.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used_at)')
+    _conn.execute('''CREATE TABLE IF NOT EXISTS email_labels (
+        user_id INTEGER,
+        message_id TEXT,
+        features TEXT,
+        label INTEGER,
+        created_at TEXT,
+        PRIMARY KEY (user_id, message_id)
+    )''')
+    _conn.execute('CREATE INDEX IF NOT EXISTS idx_email_labels_created_at ON email_labels (created_at)')
+    _conn.execute('''CREATE TABLE IF NOT EXISTS thread_applications (
+        user_id INTEGER,
+        thread_id TEXT,
+        application_id INTEGER,
+        updated_at TEXT,
+        PRIMARY KEY (user_id, thread_id)
+    )''')
+    _conn.execute('CREATE TABLE IF NOT EXISTS gmail_credentials (user_id INTEGER PRIMARY KEY, access_token TEXT, refresh_token TEXT, token_expiry TEXT, updated_at TEXT)')
+    _conn.execute('CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, user_id INTEGER, created_at TEXT, expires_at TEXT)')
+    _conn.execute('CREATE TABLE IF NOT EXISTS login_codes (code TEXT PRIMARY KEY, user_id INTEGER, expires_at TEXT)')
+
+
+def normalize_key(text: str) -> str:
+    """Case- and whitespace-insensitive form of a company or position name"""
+    return re.sub(r'\s+', ' ', (text or '').strip().lower())
+
+
+def _migrate_application_keys(conn):
+    """v1: stored company_key/position_key columns with a unique index, so lookups and upserts use the index"""
+    columns = {r[1] for r in conn.execute('PRAGMA table_info(applications)')}
+    for column in ('company_key', 'position_key'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE applications ADD COLUMN {column} TEXT')
+    # Backfill and collapse rows that only differed by case/whitespace, keeping the most recently updated one
+    keep = {}
+    for app_id, user_id, company, position, date_added in conn.execute('SELECT id, user_id, company, position, date_added FROM applications ORDER BY date_added, id').fetchall():
+        key = (user_id, normalize_key(company), normalize_key(position))
+        if key in keep:
+            conn.execute('UPDATE thread_applications SET application_id = ? WHERE application_id = ?', (app_id, keep[key]))
+            conn.execute('DELETE FROM applications WHERE id = ?', (keep[key],))
+        keep[key] = app_id
+        conn.execute('UPDATE applications SET company_key = ?, position_key = ? WHERE id = ?', (key[1], key[2], app_id))
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_applications_key ON applications (user_id, company_key, position_key)')
+
+
+def _add_application_query_indexes(conn):
+    """v2: indexes behind query_applications' stage filter, prefix search and sort orders"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_applications_user_date ON applications (user_id, date_added)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_applications_user_stage_date ON applications (user_id, stage, date_added)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_applications_user_stage_company ON applications (user_id, stage, company_key, position_key)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_applications_user_position ON applications (user_id, position_key)')
+
+
+def _secure_sessions(conn):
+    """v3: sessions expire and are stored hashed, Gmail tokens encrypted. Rows written before this were
+    neither (and session tokens travelled in URLs), so they are dropped: users sign in once more"""
+    if 'expires_at' not in {r[1] for r in conn.execute('PRAGMA table_info(sessions)')}:
+        conn.execute('ALTER TABLE sessions ADD COLUMN expires_at TEXT')
+    conn.execute('DELETE FROM sessions')
+    conn.execute('DELETE FROM gmail_credentials')
+
+
+def _add_analysis_retry_state(conn):
+    """v4: attempt count and next retry time for messages whose analysis errored"""
+    columns = {r[1] for r in conn.execute('PRAGMA table_info(processed_messages)')}
+    if 'attempts' not in columns:
+        conn.execute('ALTER TABLE processed_messages ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+    if 'retry_at' not in columns:
+        conn.execute('ALTER TABLE processed_messages ADD COLUMN retry_at REAL')
+    conn.execute("UPDATE processed_messages SET attempts = 1, retry_at = 0 WHERE outcome = 'error'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_messages_retry ON processed_messages (user_id, retry_at) WHERE outcome = 'error'")
+
+
+_MIGRATIONS = [_migrate_application_keys, _add_application_query_indexes, _secure_sessions, _add_analysis_retry_state]
+
+with transaction() as _conn:
+    _version = _conn.execute('PRAGMA user_version').fetchone()[0]
+    for _migration in _MIGRATIONS[_version:]:
+        _migration(_conn)
+    _conn.execute(f'PRAGMA user_version = {len(_MIGRATIONS)}')
 
 
 def ensure_user(email: str) -> int:
-    cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
-    row = cursor.fetchone()
-    if row:
-        return row[0]
-    cursor.execute('INSERT INTO users (email, created_at) VALUES (?, ?)', (email, datetime.now().isoformat()))
-    conn.commit()
+    with transaction() as conn:
+        row = conn.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()
+        if row:
+            return row[0]
+        user_id = conn.execute('INSERT INTO users (email, created_at) VALUES (?, ?)', (email, datetime.now().isoformat())).lastrowid
     print(f"✅ New user {email} added to DB")
-    return cursor.lastrowid
+    return user_id
+
+
+def get_user_id(email: str):
+    row = get_connection().execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()
+    return row[0] if row else None
+
+
+def get_user_email(user_id: int):
+    row = get_connection().execute('SELECT email FROM users WHERE id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def _token_cipher():
+    """Fernet key for stored Gmail tokens: GMAIL_TOKEN_KEY, or derived from FLASK_SECRET_KEY"""
+    if not (secret := os.getenv('GMAIL_TOKEN_KEY') or os.getenv('FLASK_SECRET_KEY')):
+        raise RuntimeError("FLASK_SECRET_KEY (or GMAIL_TOKEN_KEY) is required to store Gmail credentials")
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(secret.encode()).digest()))
+
+
+def save_gmail_credentials(user_id: int, credentials):
+    """credentials: GmailService.get_credentials_dict(); only the tokens are stored (encrypted), client config comes from env"""
+    if not credentials:
+        return
+    cipher = _token_cipher()
+    with transaction() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO gmail_credentials (user_id, access_token, refresh_token, token_expiry, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (user_id, cipher.encrypt(credentials['access_token'].encode()).decode(), cipher.encrypt(credentials['refresh_token'].encode()).decode(),
+             credentials.get('token_expiry'), datetime.now().isoformat()),
+        )
+
+
+def get_gmail_credentials(user_id: int):
+    """Decrypted tokens, or None when missing or sealed with a different key (the user reconnects Gmail)"""
+    row = get_connection().execute('SELECT access_token, refresh_token, token_expiry FROM gmail_credentials WHERE user_id = ?', (user_id,)).fetchone()
+    if not row:
+        return None
+    try:
+        cipher = _token_cipher()
+        return {"access_token": cipher.decrypt(row[0].encode()).decode(), "refresh_token": cipher.decrypt(row[1].encode()).decode(), "token_expiry": row[2]}
+    except InvalidToken:
+        return None
+
+
+def _hash_token(token: str) -> str:
+    # Only digests are stored, so a copy of the DB holds no usable session tokens
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_login_code(user_id: int) -> str:
+    """Short-lived, single-use code handed to the frontend in the OAuth redirect instead of a session token"""
+    code = secrets.token_urlsafe(32)
+    with transaction() as conn:
+        conn.execute('DELETE FROM login_codes WHERE expires_at < ?', (datetime.now().isoformat(),))
+        conn.execute('INSERT INTO login_codes (code, user_id, expires_at) VALUES (?, ?, ?)', (_hash_token(code), user_id, (datetime.now() + _LOGIN_CODE_TTL).isoformat()))
+    return code
+
+
+def redeem_login_code(code: str):
+    """Swap a login code for a new session token; None if the code is unknown, used or expired"""
+    if not code:
+        return None
+    with transaction() as conn:
+        row = conn.execute('DELETE FROM login_codes WHERE code = ? RETURNING user_id, expires_at', (_hash_token(code),)).fetchone()
+        if not row or row[1] < datetime.now().isoformat():
+            return None
+        return create_session(row[0])
+
+
+def create_session(user_id: int) -> str:
+    token, now = secrets.token_urlsafe(32), datetime.now()
+    with transaction() as conn:
+        conn.execute('DELETE FROM sessions WHERE expires_at < ?', (now.isoformat(),))
+        conn.execute('INSERT INTO sessions (token, user_id, created_at, expires_at) VALUES (?, ?, ?, ?)', (_hash_token(token), user_id, now.isoformat(), (now + _SESSION_TTL).isoformat()))
+    return token
+
+
+def get_session_user(token: str):
+    if not token:
+        return None
+    row = get_connection().execute('SELECT user_id FROM sessions WHERE token = ? AND expires_at > ?', (_hash_token(token), datetime.now().isoformat())).fetchone()
+    return row[0] if row else None
+
+
+def delete_session(token: str):
+    if token:
+        with transaction() as conn:
+            conn.execute('DELETE FROM sessions WHERE token = ?', (_hash_token(token),))
 
 
 def get_user_applications(user_id: int):
-    cursor.execute('SELECT id, company, position, stage, date_added FROM applications WHERE user_id = ?', (user_id,))
+    rows = get_connection().execute('SELECT id, company, position, stage, date_added FROM applications WHERE user_id = ?', (user_id,)).fetchall()
     return [
         {"id": r[0], "company": r[1], "position": r[2], "stage": r[3], "date_added": r[4]}
-        for r in cursor.fetchall()
+        for r in rows
     ]
 
 
-def save_application(user_id: int, company: str, position: str, stage: str):
-    cursor.execute(
-        'SELECT id, stage FROM applications WHERE user_id = ? AND lower(company) = lower(?) AND lower(position) = lower(?)',
-        (user_id, company, position),
-    )
-    row = cursor.fetchone()
+# sort name -> (keyset columns, direction); each pair is unique per user so cursors never skip rows
+_APPLICATION_SORTS = {
+    'date_desc': (('date_added', 'id'), 'DESC'),
+    'date_asc': (('date_added', 'id'), 'ASC'),
+    'company_asc': (('company_key', 'position_key'), 'ASC'),
+    'company_desc': (('company_key', 'position_key'), 'DESC'),
+}
+
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def query_applications(user_id: int, stage=None, search=None, date_from=None, date_to=None, sort='date_desc', cursor=None, limit=50):
+    """One page of a user's applications, plus per-stage counts for the same filters minus the stage.
+    search matches a company or position prefix; date_to without a time covers the whole day."""
+    if sort not in _APPLICATION_SORTS:
+        raise ValueError(f"Unknown sort '{sort}', expected one of {', '.join(_APPLICATION_SORTS)}")
+    columns, direction = _APPLICATION_SORTS[sort]
+    where, params = ['user_id = ?'], [user_id]
+    if search := normalize_key(search):
+        # Range scans on the key indexes instead of LIKE, which SQLite can't index case-insensitively here
+        upper = search + '\U0010ffff'
+        where.append('((company_key >= ? AND company_key < ?) OR (position_key >= ? AND position_key < ?))')
+        params += [search, upper, search, upper]
+    if date_from:
+        where.append('date_added >= ?')
+        params.append(date_from)
+    if date_to:
+        where.append('date_added <= ?')
+        params.append(date_to if len(date_to) > 10 else f'{date_to} 23:59:59')
+
+    conn = get_connection()
+    counts = dict(conn.execute(f'SELECT stage, count(*) FROM applications WHERE {" AND ".join(where)} GROUP BY stage', params).fetchall())
+    if stage:
+        where.append('stage = ?')
+        params.append(stage)
+    if cursor:
+        where.append(f'({", ".join(columns)}) {"<" if direction == "DESC" else ">"} (?, ?)')
+        params += _decode_cursor(cursor)
+    rows = conn.execute(
+        f'''SELECT id, company, position, stage, date_added, {", ".join(columns)} FROM applications
+            WHERE {" AND ".join(where)} ORDER BY {columns[0]} {direction}, {columns[1]} {direction} LIMIT ?''',
+        (*params, limit + 1),
+    ).fetchall()
+    return {
+        "applications": [{"id": r[0], "company": r[1], "position": r[2], "stage": r[3], "date_added": r[4]} for r in rows[:limit]],
+        "counts": counts,
+        "next_cursor": _encode_cursor(list(rows[limit - 1][5:])) if len(rows) > limit else None
+    }
+
+
+_UPSERT_APPLICATION = '''INSERT INTO applications (user_id, company, position, stage, date_added, company_key, position_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, company_key, position_key) DO UPDATE SET
+        stage = excluded.stage,
+        date_added = CASE WHEN stage = excluded.stage THEN date_added ELSE excluded.date_added END'''
+
+
+def _application_row(user_id, company, position, stage, now):
+    return (user_id, company, position, stage, now, normalize_key(company), normalize_key(position))
+
+
+def save_application(user_id: int, company: str, position: str, stage: str) -> int:
+    """Insert or move an application to `stage` in one statement via the normalized-key index; returns its id"""
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with transaction() as conn:
+        return conn.execute(_UPSERT_APPLICATION + ' RETURNING id', _application_row(user_id, company, position, stage, now)).fetchone()[0]
+
+
+def save_applications(rows):
+    """Batch save_application for (user_id, company, position, stage) rows; returns their ids in order"""
+    now, rows = datetime.now().strftime('%Y-%m-%d %H:%M:%S'), list(rows)
+    with transaction() as conn:
+        conn.executemany(_UPSERT_APPLICATION, [_application_row(*row, now) for row in rows])
+        return [
+            conn.execute('SELECT id FROM applications WHERE user_id = ? AND company_key = ? AND position_key = ?',
+                         (user_id, normalize_key(company), normalize_key(position))).fetchone()[0]
+            for user_id, company, position, _ in rows
+        ]
+
+
+def get_history_id(user_id: int):
+    row = get_connection().execute('SELECT history_id FROM gmail_sync_state WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def save_history_id(user_id: int, history_id: str):
+    save_history_ids([(user_id, history_id)])
+
+
+def save_history_ids(rows):
+    """rows: iterable of (user_id, history_id)"""
+    now = datetime.now().isoformat()
+    with transaction() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO gmail_sync_state (user_id, history_id, updated_at) VALUES (?, ?, ?)',
+            [(user_id, str(history_id), now) for user_id, history_id in rows],
+        )
+
+
+_MAX_SQL_PARAMS = 900  # Stay under SQLite's default host parameter limit
+
+
+def get_processed_message_ids(user_id: int, message_ids):
+    """Return the subset of message_ids already settled in the ledger for this user; errored ones are retried"""
+    conn, message_ids, found = get_connection(), list(message_ids), set()
+    for start in range(0, len(message_ids), _MAX_SQL_PARAMS):
+        chunk = message_ids[start:start + _MAX_SQL_PARAMS]
+        rows = conn.execute(
+            f'SELECT message_id FROM processed_messages WHERE user_id = ? AND outcome != \'error\' AND message_id IN ({",".join("?" * len(chunk))})',
+            (user_id, *chunk),
+        ).fetchall()
+        found.update(r[0] for r in rows)
+    return found
+
+
+def record_processed_messages(user_id: int, entries):
+    """entries: iterable of (message_id, outcome, analyzer_version)"""
+    record_processed_rows((user_id, *entry) for entry in entries)
+
+
+def record_processed_rows(rows):
+    """rows: iterable of (user_id, message_id, outcome, analyzer_version), possibly spanning users.
+    Each 'error' counts an attempt and doubles the retry delay; after ANALYSIS_MAX_ATTEMPTS the message is 'failed' for good"""
+    now = datetime.now()
+    with transaction() as conn:
+        conn.executemany(
+            """INSERT INTO processed_messages (user_id, message_id, outcome, analyzer_version, processed_at, attempts, retry_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (user_id, message_id) DO UPDATE SET
+                   outcome = CASE WHEN excluded.outcome = 'error' AND attempts + 1 >= ? THEN 'failed' ELSE excluded.outcome END,
+                   analyzer_version = excluded.analyzer_version,
+                   processed_at = excluded.processed_at,
+                   attempts = attempts + excluded.attempts,
+                   retry_at = CASE WHEN excluded.outcome = 'error' THEN ? + ? * (1 << attempts) END""",
+            [(*row, now.isoformat(), int(row[2] == 'error'), now.timestamp() + _RETRY_BASE_SECONDS if row[2] == 'error' else None,
+              _MAX_ANALYSIS_ATTEMPTS, now.timestamp(), _RETRY_BASE_SECONDS) for row in rows],
+        )
+
+
+def get_failed_message_ids(user_id: int, limit: int = 10):
+    """Messages whose analysis errored and whose backoff has elapsed, longest-waiting first"""
+    rows = get_connection().execute(
+        "SELECT message_id FROM processed_messages WHERE user_id = ? AND outcome = 'error' AND retry_at <= ? ORDER BY retry_at LIMIT ?",
+        (user_id, datetime.now().timestamp(), limit),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def prune_processed_messages(max_age_days: int = 30) -> int:
+    with transaction() as conn:
+        return conn.execute('DELETE FROM processed_messages WHERE processed_at < ?', ((datetime.now() - timedelta(days=max_age_days)).isoformat(),)).rowcount
 
-    if row:
-        if stage != row[1]:
-            cursor.execute('UPDATE applications SET stage = ?, date_added = ? WHERE id = ?', (stage, now, row[0]))
-            conn.commit()
-    else:
-        cursor.execute(
-            'INSERT INTO applications (user_id, company, position, stage, date_added) VALUES (?, ?, ?, ?, ?)',
-            (user_id, company, position, stage, now),
+
+def get_cached_analysis(cache_key: str, min_created_at: float):
+    """Return (created_at, result dict) for a live cache entry, or None. Read-only: hits are recorded via touch_analysis_cache"""
+    row = get_connection().execute('SELECT created_at, result FROM analysis_cache WHERE cache_key = ? AND created_at >= ?', (cache_key, min_created_at)).fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+
+def touch_analysis_cache(rows):
+    """rows: iterable of (cache_key, last_used_at)"""
+    with transaction() as conn:
+        conn.executemany('UPDATE analysis_cache SET last_used_at = MAX(last_used_at, ?) WHERE cache_key = ?', [(used_at, key) for key, used_at in rows])
+
+
+def put_cached_analysis(cache_key: str, result_json: str, created_at: float):
+    with transaction() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO analysis_cache (cache_key, result, created_at, last_used_at) VALUES (?, ?, ?, ?)',
+            (cache_key, result_json, created_at, created_at),
+        )
+
+
+def evict_analysis_cache(min_created_at: float, max_entries: int):
+    """Drop expired entries, then the least recently used ones beyond max_entries"""
+    with transaction() as conn:
+        conn.execute('DELETE FROM analysis_cache WHERE created_at < ?', (min_created_at,))
+        conn.execute(
+            'DELETE FROM analysis_cache WHERE cache_key IN (SELECT cache_key FROM analysis_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)',
+            (max_entries,),
+        )
+
+
+def save_email_label(user_id: int, message_id: str, features, label: int):
+    save_email_labels([(user_id, message_id, features, label)])
+
+
+def save_email_labels(rows):
+    """rows: iterable of (user_id, message_id, features, label)"""
+    now = datetime.now().isoformat()
+    with transaction() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO email_labels (user_id, message_id, features, label, created_at) VALUES (?, ?, ?, ?, ?)',
+            [(user_id, message_id, json.dumps(features), label, now) for user_id, message_id, features, label in rows],
         )
-        conn.commit()
-        print('✅ New application saved to DB') 
\ No newline at end of file
+
+
+def get_email_labels(limit: int = 5000):
+    """Most recent (features, label) pairs across all users, for training the pre-classifier"""
+    rows = get_connection().execute('SELECT features, label FROM email_labels ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+    return [(json.loads(r[0]), r[1]) for r in rows]
+
+
+def link_thread(user_id: int, thread_id: str, company: str, position: str):
+    """Point a Gmail thread at the application row it produced"""
+    link_threads([(user_id, thread_id, company, position)])
+
+
+def link_threads(rows):
+    """rows: iterable of (user_id, thread_id, company, position)"""
+    now = datetime.now().isoformat()
+    with transaction() as conn:
+        conn.executemany(
+            '''INSERT OR REPLACE INTO thread_applications (user_id, thread_id, application_id, updated_at)
+               SELECT ?, ?, id, ? FROM applications
+               WHERE user_id = ? AND company_key = ? AND position_key = ?''',
+            [(user_id, thread_id, now, user_id, normalize_key(company), normalize_key(position)) for user_id, thread_id, company, position in rows],
+        )
+
+
+def get_thread_applications(user_id: int, thread_ids):
+    """Map thread_id -> application dict for threads linked to an application that still exists"""
+    conn, thread_ids, found = get_connection(), list(thread_ids), {}
+    for start in range(0, len(thread_ids), _MAX_SQL_PARAMS):
+        chunk = thread_ids[start:start + _MAX_SQL_PARAMS]
+        rows = conn.execute(
+            f'''SELECT t.thread_id, a.id, a.company, a.position, a.stage FROM thread_applications t
+                JOIN applications a ON a.id = t.application_id AND a.user_id = t.user_id
+                WHERE t.user_id = ? AND t.thread_id IN ({",".join("?" * len(chunk))})''',
+            (user_id, *chunk),
+        ).fetchall()
+        for r in rows:
+            found[r[0]] = {"id": r[1], "company": r[2], "position": r[3], "stage": r[4]}
+    return found
+
+
+def delete_application(user_id: int, app_id: int):
+    delete_applications([(user_id, app_id)])
+
+
+def delete_applications(rows):
+    """rows: iterable of (user_id, app_id)"""
+    with transaction() as conn:
+        conn.executemany('DELETE FROM applications WHERE id = ? AND user_id = ?', [(app_id, user_id) for user_id, app_id in rows])
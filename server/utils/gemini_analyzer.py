@@ -1,20 +1,45 @@
 import os
+import json
+import re
 import google.generativeai as genai
 from dotenv import load_dotenv
+from utils.analysis_cache import AnalysisCache
 
 load_dotenv()
 
 class GeminiEmailAnalyzer:
-    
+    MODEL_NAME = 'gemini-2.0-flash'
+    PROMPT_VERSION = 1
+    VERSION = f'{MODEL_NAME}/prompt-v{PROMPT_VERSION}'  # Recorded with every processed message
+
     def __init__(self):
         api_key = os.getenv('GEMINI_API_KEY')
         if not api_key or api_key.strip() == '' or api_key.strip() == "''":
             raise ValueError("❌ GEMINI_API_KEY environment variable is required and cannot be empty. Please set it in the .env file.")
         
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = genai.GenerativeModel(self.MODEL_NAME)
+        self.cache = AnalysisCache(self.VERSION)
+        self.stage_cache = AnalysisCache(f'{self.VERSION}/stage')
+        self.batch_token_budget = int(os.getenv('GEMINI_BATCH_TOKEN_BUDGET', 6000))
+        self.max_batch_size = int(os.getenv('GEMINI_MAX_BATCH_EMAILS', 10))
+        self.request_gate = None  # Optional wrapper (e.g. AnalysisExecutor.call) applied to every model request
+
+    def _generate(self, prompt):
+        if self.request_gate:
+            return self.request_gate(self.model.generate_content, prompt)
+        return self.model.generate_content(prompt)
     
     def analyze_email_for_interview_stage(self, subject, body, sender_email=""):
+        cache_key = self.cache.make_key(subject, body, sender_email)
+        if (cached := self.cache.get(cache_key)) is not None:
+            return cached
+        result = self._analyze_uncached(subject, body, sender_email)
+        if not result.get('error'):
+            self.cache.put(cache_key, result)
+        return result
+
+    def _analyze_uncached(self, subject, body, sender_email):
         prompt = f"""
         Analyze this email and extract job application information:
         
@@ -41,36 +66,159 @@ class GeminiEmailAnalyzer:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            result_text = response.text.strip()
-            
-            import json
-            import re
-            
-            json_match = re.search(r'```(?:json)?\s*(.*?)\s*```', result_text, re.DOTALL)
-            if json_match:
-                result_text = json_match.group(1).strip()
-            
-            result = json.loads(result_text)
-            
-            def clean_value(value):
-                return None if value in [None, 'null', ''] else (value.strip() if isinstance(value, str) else value)
-            
-            return {
-                'company_name': clean_value(result.get('company_name')),
-                'job_title': clean_value(result.get('job_title')),
-                'interview_stage': clean_value(result.get('interview_stage')),
-                'confidence': int(result.get('confidence', 0))
-            }
-            
+            response = self._generate(prompt)
+            return self._clean_result(self._parse_json(response.text))
         except Exception as e:
             print(f"❌ Gemini analysis error: {e}")
-            return {
-                'company_name': None,
-                'job_title': None,
-                'interview_stage': None,
-                'confidence': 0
-            }
+            return self._error_result(e)
+
+    def classify_stage(self, subject, body, company, position):
+        """Stage-only classification for follow-ups on a thread whose application is already known"""
+        cache_key = self.stage_cache.make_key(subject, body, f'{company}\x1f{position}')
+        if (cached := self.stage_cache.get(cache_key)) is not None:
+            return cached
+
+        prompt = f"""
+        This email is a follow-up about the {position} application at {company}.
+        
+        Subject: {subject}
+        Body: {body}
+        
+        Classify the interview stage (choose from: application_received, phone_screen, technical_interview, 
+        behavioral_interview, final_interview, offer, rejected, other) with a confidence level (0-100).
+        Return only JSON: {{"interview_stage": "stage", "confidence": confidence_score}}
+        """
+
+        try:
+            response = self._generate(prompt)
+            parsed = self._parse_json(response.text)
+            stage = parsed.get('interview_stage')
+            result = {'interview_stage': None if stage in [None, 'null', '', 'other'] else stage.strip(), 'confidence': int(parsed.get('confidence', 0))}
+            self.stage_cache.put(cache_key, result)
+            return result
+        except Exception as e:
+            print(f"❌ Gemini stage classification error: {e}")
+            return {'interview_stage': None, 'confidence': 0, 'error': str(e)}
+
+    def analyze_batch(self, emails):
+        """Analyze several emails with as few model calls as the token budget allows.
+        emails: [{'id', 'subject', 'body', 'sender'}]; returns {email id: result}."""
+        results, pending = {}, []
+        for email in emails:
+            cache_key = self.cache.make_key(email['subject'], email['body'], email.get('sender', ''))
+            if (cached := self.cache.get(cache_key)) is not None:
+                results[email['id']] = cached
+            else:
+                pending.append((email, cache_key))
+
+        for group in self._pack_batches(pending):
+            if len(group) == 1:
+                batch_results = {}
+            else:
+                batch_results = self._analyze_group(group)
+            for email, cache_key in group:
+                if (result := batch_results.get(email['id'])) is None:
+                    # Malformed or missing batch entry: fall back to a dedicated call
+                    result = self._analyze_uncached(email['subject'], email['body'], email.get('sender', ''))
+                if not result.get('error'):
+                    self.cache.put(cache_key, result)
+                results[email['id']] = result
+        return results
+
+    def _pack_batches(self, pending):
+        groups, current, current_tokens = [], [], 0
+        for item in pending:
+            email = item[0]
+            # Rough token estimate (~4 characters per token) is enough to stay well under the model limit
+            tokens = (len(email['subject']) + len(email['body']) + len(email.get('sender', ''))) // 4 + 50
+            if current and (current_tokens + tokens > self.batch_token_budget or len(current) >= self.max_batch_size):
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(item)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def _analyze_group(self, group):
+        """One generate_content call for a group of emails; returns only the well-formed entries"""
+        sections = "\n".join(
+            f"""
+        --- EMAIL {email['id']} ---
+        Subject: {email['subject']}
+        Body: {email['body']}
+        Sender: {email.get('sender', '')}"""
+            for email, _ in group
+        )
+        prompt = f"""
+        Analyze each of the following emails independently and extract job application information.
+        {sections}
+        
+        For each email extract:
+        1. Company name
+        2. Job title/position
+        3. Interview stage (choose from: application_received, phone_screen, technical_interview, 
+           behavioral_interview, final_interview, offer, rejected, other)
+        4. Confidence level (0-100) based on how certain you are
+        
+        Return a JSON array with exactly one object per email, in this exact format:
+        [
+            {{
+                "email_id": "the id after EMAIL",
+                "company_name": "extracted company name or null",
+                "job_title": "extracted job title or null", 
+                "interview_stage": "stage or null",
+                "confidence": confidence_score
+            }}
+        ]
+        
+        Only return the JSON, no other text.
+        """
+
+        try:
+            response = self._generate(prompt)
+            parsed = self._parse_json(response.text)
+            if not isinstance(parsed, list):
+                raise ValueError("batch response is not a JSON array")
+            expected = {str(email['id']): email['id'] for email, _ in group}
+            results = {}
+            for entry in parsed:
+                if isinstance(entry, dict) and (email_id := expected.get(str(entry.get('email_id')))) is not None:
+                    results[email_id] = self._clean_result(entry)
+            return results
+        except Exception as e:
+            print(f"⚠️ Gemini batch analysis failed, falling back to per-email calls: {e}")
+            return {}
+
+    @staticmethod
+    def _parse_json(text):
+        result_text = text.strip()
+        json_match = re.search(r'```(?:json)?\s*(.*?)\s*```', result_text, re.DOTALL)
+        if json_match:
+            result_text = json_match.group(1).strip()
+        return json.loads(result_text)
+
+    @staticmethod
+    def _clean_result(result):
+        def clean_value(value):
+            return None if value in [None, 'null', ''] else (value.strip() if isinstance(value, str) else value)
+
+        return {
+            'company_name': clean_value(result.get('company_name')),
+            'job_title': clean_value(result.get('job_title')),
+            'interview_stage': clean_value(result.get('interview_stage')),
+            'confidence': int(result.get('confidence', 0))
+        }
+
+    @staticmethod
+    def _error_result(error):
+        return {
+            'company_name': None,
+            'job_title': None,
+            'interview_stage': None,
+            'confidence': 0,
+            'error': str(error)
+        }
 
 
 def main():
@@ -0,0 +1,108 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# Footers/links that only show up in real applicant-tracking-system mail; these are never skipped
+ATS_MARKERS = {
+    'greenhouse': r'greenhouse(-mail)?\.io', 'lever': r'lever\.co', 'workday': r'myworkday(jobs)?\.com|workday\.com',
+    'ashby': r'ashbyhq\.com', 'smartrecruiters': r'smartrecruiters\.com', 'icims': r'icims\.com',
+    'jobvite': r'jobvite\.com', 'taleo': r'taleo\.net', 'successfactors': r'successfactors\.(com|eu)'
+}
+_ATS_PATTERNS = {name: re.compile(pattern, re.IGNORECASE) for name, pattern in ATS_MARKERS.items()}
+_TOKEN_PATTERN = re.compile(r'[a-z][a-z0-9]{2,}')
+_SENDER_DOMAIN_PATTERN = re.compile(r'@([\w.-]+)')
+
+
+def extract_features(email):
+    """Sparse binary features from sender domain, subject tokens and ATS/bulk-mail markers"""
+    sender, subject, body = email.get('sender', '').lower(), email.get('subject', '').lower(), email.get('body', '')
+    features = set()
+    if match := _SENDER_DOMAIN_PATTERN.search(sender):
+        domain = match.group(1).strip('.>')
+        features.add(f'domain:{domain}')
+        features.add(f'domain:{".".join(domain.split(".")[-2:])}')
+    local_part = sender.split('@')[0]
+    for marker in ('noreply', 'no-reply', 'newsletter', 'news', 'alerts', 'jobs', 'careers', 'recruiting', 'talent', 'hr'):
+        if marker in local_part:
+            features.add(f'sender:{marker}')
+    features.update(f'subj:{token}' for token in _TOKEN_PATTERN.findall(subject))
+    features.update(f'ats:{name}' for name, pattern in _ATS_PATTERNS.items() if pattern.search(body) or pattern.search(sender))
+    if 'unsubscribe' in body.lower():
+        features.add('bulk:unsubscribe')
+    return sorted(features)
+
+
+class PreClassifier:
+    """Naive Bayes filter in front of the analyzer that drops obvious non-job mail.
+    Trained from the labels recorded for model-analyzed emails; never skips anything until trained."""
+
+    def __init__(self, skip_threshold=None, shadow_mode=None, min_examples=None):
+        self.skip_threshold = skip_threshold if skip_threshold is not None else float(os.getenv('PRECLASSIFIER_SKIP_THRESHOLD', 0.05))
+        self.shadow_mode = shadow_mode if shadow_mode is not None else os.getenv('PRECLASSIFIER_SHADOW', '').lower() in ('1', 'true', 'yes')
+        self.min_examples = min_examples or int(os.getenv('PRECLASSIFIER_MIN_EXAMPLES', 10))
+        self._lock = threading.Lock()
+        self._model = None
+        self.training_examples = 0
+        self.skipped = 0
+        self.shadow_skips = 0
+        self.shadow_misses = 0  # Shadow skips the analyzer turned out to accept
+
+    def train(self, examples):
+        """examples: iterable of (features, label) with label 1 for job mail, 0 otherwise"""
+        counts, totals, docs = {0: Counter(), 1: Counter()}, {0: 0, 1: 0}, {0: 0, 1: 0}
+        for features, label in examples:
+            label = 1 if label else 0
+            docs[label] += 1
+            counts[label].update(features)
+            totals[label] += len(features)
+
+        if min(docs.values()) < self.min_examples:
+            model = None
+        else:
+            vocabulary = len(set(counts[0]) | set(counts[1])) + 1
+            model = {
+                'prior': {c: math.log(docs[c] / (docs[0] + docs[1])) for c in (0, 1)},
+                'log_prob': {c: {f: math.log((n + 1) / (totals[c] + vocabulary)) for f, n in counts[c].items()} for c in (0, 1)},
+                'unseen': {c: math.log(1 / (totals[c] + vocabulary)) for c in (0, 1)}
+            }
+        with self._lock:
+            self._model = model
+            self.training_examples = docs[0] + docs[1]
+        return model is not None
+
+    def job_probability(self, features):
+        with self._lock:
+            model = self._model
+        if model is None or any(f.startswith('ats:') for f in features):
+            return 1.0
+        scores = {c: model['prior'][c] + sum(model['log_prob'][c].get(f, model['unseen'][c]) for f in features) for c in (0, 1)}
+        # Softmax over the two log scores without overflowing
+        return 1 / (1 + math.exp(max(min(scores[0] - scores[1], 700), -700)))
+
+    def should_skip(self, features):
+        """True when the email can be dropped without calling the analyzer (always False in shadow mode)"""
+        if self.job_probability(features) >= self.skip_threshold:
+            return False
+        if self.shadow_mode:
+            self.shadow_skips += 1
+            return False
+        self.skipped += 1
+        return True
+
+    def report_shadow_result(self, features, is_job):
+        """In shadow mode, count would-be skips that the analyzer classified as job mail"""
+        if self.shadow_mode and is_job and self.job_probability(features) < self.skip_threshold:
+            self.shadow_misses += 1
+
+    def stats(self):
+        return {
+            'trained': self._model is not None,
+            'training_examples': self.training_examples,
+            'skip_threshold': self.skip_threshold,
+            'shadow_mode': self.shadow_mode,
+            'skipped': self.skipped,
+            'shadow_skips': self.shadow_skips,
+            'shadow_misses': self.shadow_misses
+        }
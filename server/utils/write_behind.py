@@ -0,0 +1,177 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from itertools import groupby
+
+from utils import db
+
+_FLUSH = 'flush'
+_STOP = 'stop'
+
+# Each write kind maps to a db batch function taking a list of parameter tuples
+_BATCH_HANDLERS = {
+    'save_application': db.save_applications,
+    'delete_application': db.delete_applications,
+    'link_thread': db.link_threads,
+    'record_processed': db.record_processed_rows,
+    'save_email_label': db.save_email_labels,
+    'save_history_id': db.save_history_ids,
+    'touch_analysis_cache': db.touch_analysis_cache,
+}
+
+
+class WriteBehindQueue:
+    """Single writer thread that applies queued writes in submission order, grouping whatever
+    arrives within max_latency into one transaction (one fsync) with executemany per run of
+    same-kind writes. Every submit returns a Future resolved once its batch has committed; an urgent
+    submit closes the current batch immediately instead of waiting out max_latency."""
+
+    def __init__(self, max_latency=None, max_batch=None, queue_size=None):
+        self.max_latency = (max_latency if max_latency is not None else int(os.getenv('WRITE_BEHIND_MAX_LATENCY_MS', 200))) / 1000
+        self.max_batch = max_batch or int(os.getenv('WRITE_BEHIND_MAX_BATCH', 500))
+        self._queue = queue.Queue(maxsize=queue_size or int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', 10000)))
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = False
+        self.batches = 0
+        self.writes = 0
+        self.failed_writes = 0
+        self.last_batch_size = 0
+
+    def start(self):
+        with self._lock:
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='write-behind')
+                self._thread.start()
+        return self
+
+    def save_application(self, user_id, company, position, stage, urgent=False):
+        """Future resolves to the application's DB id"""
+        return self._submit('save_application', (user_id, company, position, stage), urgent)
+
+    def delete_application(self, user_id, app_id):
+        return self._submit('delete_application', (user_id, app_id))
+
+    def link_thread(self, user_id, thread_id, company, position):
+        return self._submit('link_thread', (user_id, thread_id, company, position))
+
+    def record_processed_messages(self, user_id, entries):
+        futures = [self._submit('record_processed', (user_id, *entry)) for entry in entries]
+        return futures[-1] if futures else None
+
+    def save_email_label(self, user_id, message_id, features, label):
+        return self._submit('save_email_label', (user_id, message_id, features, label))
+
+    def save_history_id(self, user_id, history_id):
+        return self._submit('save_history_id', (user_id, history_id))
+
+    def touch_analysis_cache(self, entries):
+        """entries: (cache_key, last_used_at) pairs"""
+        futures = [self._submit('touch_analysis_cache', entry) for entry in entries]
+        return futures[-1] if futures else None
+
+    def flush(self, timeout=None):
+        """Block until every write submitted before this call has committed (read-your-writes)"""
+        if self._stopped or not self._thread:
+            return True
+        future = Future()
+        self._queue.put((_FLUSH, None, future, True))
+        return future.result(timeout=timeout)
+
+    def stop(self, timeout=10):
+        """Commit everything still queued, then stop the writer; later submits are applied inline"""
+        with self._lock:
+            if self._stopped or not self._thread:
+                self._stopped = True
+                return True
+            self._stopped = True
+        self._queue.put((_STOP, None, None, True))
+        self._thread.join(timeout=timeout)
+        return not self._thread.is_alive()
+
+    def _submit(self, kind, params, urgent=False):
+        future = Future()
+        if self._stopped:
+            self._apply([(kind, params, future, urgent)])
+        else:
+            self.start()._queue.put((kind, params, future, urgent))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_latency
+            while not batch[-1][3] and len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if writes := [op for op in batch if op[0] in _BATCH_HANDLERS]:
+                self._apply(writes)
+            kind, _, future, _ = batch[-1]
+            if kind == _FLUSH:
+                future.set_result(True)
+            elif kind == _STOP:
+                return
+
+    def _apply(self, ops):
+        try:
+            with db.transaction():
+                results = self._execute(ops)
+        except Exception as e:
+            # Don't let one bad row sink the whole group: replay each write in its own transaction
+            print(f"⚠️ Group commit of {len(ops)} writes failed ({e}), retrying individually")
+            results = []
+            for op in ops:
+                try:
+                    with db.transaction():
+                        results.extend(self._execute([op]))
+                except Exception as op_error:
+                    print(f"❌ Write-behind {op[0]} failed: {op_error}")
+                    results.append(op_error)
+        self.batches += 1
+        self.last_batch_size = len(ops)
+        for (_, _, future, _), result in zip(ops, results):
+            if isinstance(result, Exception):
+                self.failed_writes += 1
+                future.set_exception(result)
+            else:
+                self.writes += 1
+                future.set_result(result)
+
+    @staticmethod
+    def _execute(ops):
+        results = []
+        for kind, run in groupby(ops, key=lambda op: op[0]):
+            rows = [params for _, params, _, _ in run]
+            out = _BATCH_HANDLERS[kind](rows)
+            results.extend(out if out is not None else [None] * len(rows))
+        return results
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize(),
+            'batches': self.batches,
+            'writes': self.writes,
+            'failed_writes': self.failed_writes,
+            'avg_batch_size': round(self.writes / self.batches, 1) if self.batches else 0,
+            'last_batch_size': self.last_batch_size,
+            'max_latency_ms': round(self.max_latency * 1000)
+        }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Process-wide writer shared by the Flask routes and the monitor; flushed at interpreter exit"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehindQueue()
+            atexit.register(_writer.stop)
+        return _writer